@@ -53,7 +53,7 @@ try:
             break
         
         # If complete, show the video URL
-        if status == "COMPLETED":
+        if status == "SUCCEEDED":
             video_url = status_response.get("videoUrl")
             generated_code = status_response.get("generatedCode")
             
@@ -2,7 +2,10 @@
 Animo - Create animations from text using Manim
 """
 
-from .client import Animo
+from .client import Animo, AsyncAnimo
+from .polling import WaitTimeoutError
+from .streaming import RenderError, RenderEvent
+from .utils import gather_with_limit
 
 __version__ = "0.1.4"
-__all__ = ["Animo"] 
\ No newline at end of file
+__all__ = ["Animo", "AsyncAnimo", "RenderError", "RenderEvent", "WaitTimeoutError", "gather_with_limit"] 
\ No newline at end of file
@@ -1,11 +1,20 @@
-from .resources.videos import Videos
+from .resources.videos import AsyncVideos, Videos
+from .transport import AsyncTransport, Transport
 
 class Animo:
     """
     Animo client for interacting with the Animo API.
     """
     
-    def __init__(self, api_key: str, base_url: str = "https://api.animo.video"):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.animo.video",
+        timeout: float = 300.0,
+        connect_timeout: float = 10.0,
+        max_retries: int = 3,
+        pool_size: int = 10,
+    ):
         """
         Initialize the Animo client.
 
@@ -13,9 +22,96 @@ class Animo:
             api_key (str): Your API key for authentication
             base_url (str, optional): The base URL for the API. 
                 Defaults to "https://api.animo.video"
+            timeout (float, optional): Seconds to wait for a response. Defaults to 300.
+                Renders wait for their video without limit, see `videos.create`
+            connect_timeout (float, optional): Seconds to wait for a connection. Defaults to 10
+            max_retries (int, optional): Retries of a request on connection errors,
+                429 and 5xx responses. Defaults to 3
+            pool_size (int, optional): Connections kept alive to the API, to
+                share between threads. Defaults to 10
         """
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
+
+        # Shared by every resource, so connections are reused between calls
+        self._transport = Transport(
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            max_retries=max_retries,
+            pool_size=pool_size,
+        )
         
+        # Whether the API has the batch status endpoint, once known
+        self._supports_batch_status = None
+
         # Initialize resources
-        self.videos = Videos(self) 
\ No newline at end of file
+        self.videos = Videos(self)
+
+    def close(self):
+        """
+        Close the connections of the client.
+        """
+        self._transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncAnimo:
+    """
+    Asyncio client for interacting with the Animo API, to submit and follow
+    many videos from one event loop.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.animo.video",
+        timeout: float = 300.0,
+        connect_timeout: float = 10.0,
+        max_retries: int = 3,
+        pool_size: int = 100,
+    ):
+        """
+        Initialize the asyncio Animo client. Takes the same arguments as
+        `Animo`; `pool_size` is the maximum number of connections, requests
+        beyond it wait for a free one.
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+
+        self._transport = AsyncTransport(
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            max_retries=max_retries,
+            pool_size=pool_size,
+        )
+
+        self._supports_batch_status = None
+
+        self.videos = AsyncVideos(self)
+
+    async def close(self):
+        """
+        Close the connections of the client.
+        """
+        await self._transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
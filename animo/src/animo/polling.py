@@ -0,0 +1,119 @@
+"""
+Waiting for video generations to finish.
+
+`Videos.wait()` and `Videos.wait_many()` use the batch status endpoint with
+long polling when the API has it: the server answers as soon as one of the
+generations is finished. Otherwise they poll each generation, less often
+while nothing changes.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Statuses of generations that won't change anymore
+FINISHED_STATUSES = {"completed", "failed", "succeeded", "error"}
+# Maximum request IDs per call of the batch status endpoint
+STATUS_BATCH_SIZE = 100
+# How long the server is asked to hold a batch status request
+LONG_POLL_SECONDS = 20.0
+
+
+class WaitTimeoutError(TimeoutError):
+    """
+    Generations weren't finished before the timeout of a wait.
+    """
+
+    def __init__(self, message: str, statuses: Dict[str, Dict[str, Any]]):
+        super().__init__(message)
+        # The latest status of each generation that was still running
+        self.statuses = statuses
+
+
+def is_finished(status: Optional[Dict[str, Any]]) -> bool:
+    return str((status or {}).get("status", "")).lower() in FINISHED_STATUSES
+
+
+class PollInterval:
+    """
+    Adaptive polling interval: it grows by `factor` after each poll where
+    nothing changed, up to `maximum`, and goes back to `initial` on changes.
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 15.0, factor: float = 1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.current = initial
+
+    def next(self, changed: bool) -> float:
+        if changed:
+            self.current = self.initial
+        else:
+            self.current = min(self.current * self.factor, self.maximum)
+        return self.current
+
+
+StatusCallback = Callable[[Dict[str, Any]], None]
+
+
+class WaitState:
+    """
+    Progress of a `wait_many()` call, shared by `Videos` and `AsyncVideos`.
+    """
+
+    def __init__(self, request_ids: List[str], timeout: Optional[float], interval: PollInterval):
+        self.request_ids = list(dict.fromkeys(request_ids))
+        self.pending = list(self.request_ids)
+        self.statuses = {}
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.interval = interval
+        self.started = time.monotonic()
+
+    def get_long_poll_wait(self) -> float:
+        """
+        Returns how long the server may hold the next batch status request.
+        Beyond one batch, batches are polled without waiting.
+        """
+        self.started = time.monotonic()
+        wait = LONG_POLL_SECONDS if len(self.pending) <= STATUS_BATCH_SIZE else 0
+        if self.deadline is not None:
+            wait = max(0, min(wait, self.deadline - self.started))
+        return wait
+
+    def update(self, statuses: Dict[str, Optional[Dict[str, Any]]], on_update: Optional[StatusCallback]) -> bool:
+        """
+        Records the latest statuses, and returns whether any of them changed.
+        """
+        changed = False
+        for request_id, status in statuses.items():
+            if status is None:
+                raise ValueError(f"Request not found: {request_id}")
+            if status != self.statuses.get(request_id):
+                changed = True
+                self.statuses[request_id] = status
+                if on_update:
+                    on_update(status)
+            if is_finished(status):
+                self.pending.remove(request_id)
+        return changed
+
+    def get_results(self) -> Dict[str, Dict[str, Any]]:
+        return {request_id: self.statuses[request_id] for request_id in self.request_ids}
+
+    def get_delay(self, changed: bool) -> float:
+        """
+        Returns how long to wait before the next poll. Raises
+        `WaitTimeoutError` once the timeout is over.
+        """
+        now = time.monotonic()
+        if self.deadline is not None and now >= self.deadline:
+            raise WaitTimeoutError(
+                f"{len(self.pending)} generation(s) still running after {self.timeout} seconds",
+                {request_id: self.statuses[request_id] for request_id in self.pending},
+            )
+        # A long poll that was held by the server already waited
+        delay = self.interval.next(changed) - (now - self.started)
+        if self.deadline is not None:
+            delay = min(delay, self.deadline - now)
+        return max(delay, 0)
@@ -1,5 +1,12 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
 import requests
-from typing import Dict, Any
+
+from ..polling import STATUS_BATCH_SIZE, PollInterval, StatusCallback, WaitState
+from ..streaming import EventCallback, RenderEvent, get_render_result, parse_event_line
 
 class Videos:
     """
@@ -14,7 +21,9 @@ class Videos:
         code: str, 
         file_class: str = "GenScene",
         aspect_ratio: str = "16:9",
-        stream: bool = False
+        stream: bool = False,
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Create a video by rendering Manim code.
@@ -24,26 +33,82 @@ class Videos:
             file_class (str, optional): The Manim scene class name. Defaults to "GenScene"
             aspect_ratio (str, optional): Video aspect ratio ("16:9", "1:1", "9:16"). Defaults to "16:9"
             stream (bool, optional): Whether to stream the rendering progress. Defaults to False
+            on_event (Callable[[RenderEvent], None], optional): Called with each
+                progress event, as it arrives, when streaming
+            timeout (float, optional): Seconds to wait for the render, or
+                between two progress events when streaming. Defaults to no limit
 
         Returns:
             Dict[str, Any]: The API response containing the video URL
+
+        Raises:
+            RenderError: If the render fails while streaming
         """
-        response = requests.post(
-            f"{self.client.base_url}/v1/video/rendering",
-            headers={
-                "Authorization": f"Bearer {self.client.api_key}",
-                "Content-Type": "application/json"
-            },
+        if stream:
+            return get_render_result(
+                self.create_stream(code, file_class, aspect_ratio, on_event=on_event, timeout=timeout)
+            )
+        response = self.client._transport.request(
+            "POST",
+            "/v1/video/rendering",
             json={
                 "code": code,
                 "file_class": file_class,
                 "aspect_ratio": aspect_ratio,
                 "stream": stream
-            }
+            },
+            timeout=timeout
         )
-        response.raise_for_status()
         return response.json()
 
+    def create_stream(
+        self,
+        code: str,
+        file_class: str = "GenScene",
+        aspect_ratio: str = "16:9",
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None
+    ) -> Iterator[RenderEvent]:
+        """
+        Create a video by rendering Manim code, and iterate over the progress
+        of the render as it arrives. The request is sent when the iteration
+        starts.
+
+        Args:
+            code (str): The Manim Python code to render
+            file_class (str, optional): The Manim scene class name. Defaults to "GenScene"
+            aspect_ratio (str, optional): Video aspect ratio ("16:9", "1:1", "9:16"). Defaults to "16:9"
+            on_event (Callable[[RenderEvent], None], optional): Called with each event
+            timeout (float, optional): Seconds to wait between two events.
+                Defaults to no limit
+
+        Yields:
+            RenderEvent: The progress of each animation, then the video URL or an error
+        """
+        response = self.client._transport.request(
+            "POST",
+            "/v1/video/rendering",
+            json={
+                "code": code,
+                "file_class": file_class,
+                "aspect_ratio": aspect_ratio,
+                "stream": True
+            },
+            stream=True,
+            timeout=timeout
+        )
+        try:
+            # Without a chunk size, lines are read as the server sends them
+            for line in response.iter_lines(chunk_size=None):
+                event = parse_event_line(line)
+                if event is None:
+                    continue
+                if on_event:
+                    on_event(event)
+                yield event
+        finally:
+            response.close()
+
     def generate(
         self,
         prompt: str,
@@ -61,19 +126,15 @@ class Videos:
         Returns:
             Dict[str, Any]: The API response containing the request ID and status
         """
-        response = requests.post(
-            f"{self.client.base_url}/v1/video/generation",
-            headers={
-                "Authorization": f"Bearer {self.client.api_key}",
-                "Content-Type": "application/json"
-            },
+        response = self.client._transport.request(
+            "POST",
+            "/v1/video/generation",
             json={
                 "prompt": prompt,
                 "engine": engine,
                 "model": model
             }
         )
-        response.raise_for_status()
         return response.json()
 
     def retrieve(self, request_id: str) -> Dict[str, Any]:
@@ -86,16 +147,107 @@ class Videos:
         Returns:
             Dict[str, Any]: The API response containing the status and video URL if completed
         """
-        response = requests.get(
-            f"{self.client.base_url}/v1/video/generation/status/{request_id}",
-            headers={
-                "Authorization": f"Bearer {self.client.api_key}",
-                "Content-Type": "application/json"
-            }
+        response = self.client._transport.request(
+            "GET",
+            f"/v1/video/generation/status/{request_id}"
         )
-        response.raise_for_status()
         return response.json()
 
+    def retrieve_many(self, request_ids: List[str], wait: float = 0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Retrieve the status of several video generation requests in one call.
+
+        Args:
+            request_ids (List[str]): The IDs of the generation requests, at most 100
+            wait (float, optional): Seconds the server may wait for one of the
+                requests to finish before responding. Defaults to 0
+
+        Returns:
+            Dict[str, Optional[Dict[str, Any]]]: The status of each request by ID,
+                None for unknown IDs
+        """
+        response = self.client._transport.request(
+            "POST",
+            "/v1/video/generation/status",
+            json={
+                "requestIds": request_ids,
+                "wait": wait
+            }
+        )
+        return response.json()["jobs"]
+
+    def wait(
+        self,
+        request_id: str,
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 15.0,
+        on_update: Optional[StatusCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Wait for a video generation request to finish. See `wait_many`.
+
+        Returns:
+            Dict[str, Any]: The final status of the request
+        """
+        return self.wait_many(
+            [request_id],
+            timeout=timeout,
+            poll_interval=poll_interval,
+            max_poll_interval=max_poll_interval,
+            on_update=on_update
+        )[request_id]
+
+    def wait_many(
+        self,
+        request_ids: List[str],
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 15.0,
+        on_update: Optional[StatusCallback] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Wait for video generation requests to finish (SUCCEEDED or FAILED).
+
+        Uses the batch status endpoint with long polling when the API has it.
+        Otherwise polls each request, every `poll_interval` seconds at first,
+        then less often while nothing changes, up to `max_poll_interval`.
+
+        Args:
+            request_ids (List[str]): The IDs of the generation requests
+            timeout (float, optional): Seconds to wait at most. Defaults to no limit
+            poll_interval (float, optional): Initial seconds between polls. Defaults to 1
+            max_poll_interval (float, optional): Maximum seconds between polls. Defaults to 15
+            on_update (Callable[[Dict], None], optional): Called with each new status
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The final status of each request by ID
+
+        Raises:
+            WaitTimeoutError: If requests are still running after `timeout`
+        """
+        state = WaitState(request_ids, timeout, PollInterval(poll_interval, max_poll_interval))
+        while True:
+            changed = state.update(self._poll(state.pending, state.get_long_poll_wait()), on_update)
+            if not state.pending:
+                return state.get_results()
+            time.sleep(state.get_delay(changed))
+
+    def _poll(self, request_ids: List[str], wait: float) -> Dict[str, Optional[Dict[str, Any]]]:
+        if self.client._supports_batch_status is not False:
+            try:
+                statuses = {}
+                for i in range(0, len(request_ids), STATUS_BATCH_SIZE):
+                    statuses.update(self.retrieve_many(request_ids[i:i + STATUS_BATCH_SIZE], wait=wait))
+                self.client._supports_batch_status = True
+                return statuses
+            except requests.HTTPError as e:
+                # APIs without the batch status endpoint
+                if self.client._supports_batch_status or e.response.status_code not in (404, 405):
+                    raise
+                self.client._supports_batch_status = False
+        return {request_id: self.retrieve(request_id) for request_id in request_ids}
+
     def export(self, scenes: list, title_slug: str) -> Dict[str, Any]:
         """
         Export multiple scenes into a single video.
@@ -107,16 +259,202 @@ class Videos:
         Returns:
             Dict[str, Any]: The API response containing the exported video URL
         """
-        response = requests.post(
-            f"{self.client.base_url}/v1/video/exporting",
-            headers={
-                "Authorization": f"Bearer {self.client.api_key}",
-                "Content-Type": "application/json"
+        response = self.client._transport.request(
+            "POST",
+            "/v1/video/exporting",
+            json={
+                "scenes": scenes,
+                "titleSlug": title_slug
+            }
+        )
+        return response.json() 
+
+class AsyncVideos:
+    """
+    Handle video-related operations with the Animo API, with asyncio.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create(
+        self,
+        code: str,
+        file_class: str = "GenScene",
+        aspect_ratio: str = "16:9",
+        stream: bool = False,
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a video by rendering Manim code. See `Videos.create`.
+        """
+        if stream:
+            events = [
+                event
+                async for event in self.create_stream(code, file_class, aspect_ratio, on_event=on_event, timeout=timeout)
+            ]
+            return get_render_result(events)
+        response = await self.client._transport.request(
+            "POST",
+            "/v1/video/rendering",
+            json={
+                "code": code,
+                "file_class": file_class,
+                "aspect_ratio": aspect_ratio,
+                "stream": stream
             },
+            timeout=timeout
+        )
+        return response.json()
+
+    async def create_stream(
+        self,
+        code: str,
+        file_class: str = "GenScene",
+        aspect_ratio: str = "16:9",
+        on_event: Optional[EventCallback] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[RenderEvent]:
+        """
+        Create a video by rendering Manim code, and iterate over the progress
+        of the render as it arrives. See `Videos.create_stream`.
+        """
+        response = await self.client._transport.request(
+            "POST",
+            "/v1/video/rendering",
+            json={
+                "code": code,
+                "file_class": file_class,
+                "aspect_ratio": aspect_ratio,
+                "stream": True
+            },
+            stream=True,
+            timeout=timeout
+        )
+        try:
+            async for line in response.aiter_lines():
+                event = parse_event_line(line)
+                if event is None:
+                    continue
+                if on_event:
+                    on_event(event)
+                yield event
+        finally:
+            await response.aclose()
+
+    async def generate(
+        self,
+        prompt: str,
+        engine: str = "anthropic",
+        model: str = "claude-3-7-sonnet-20250219"
+    ) -> Dict[str, Any]:
+        """
+        Generate a video from a text prompt using AI. See `Videos.generate`.
+        """
+        response = await self.client._transport.request(
+            "POST",
+            "/v1/video/generation",
+            json={
+                "prompt": prompt,
+                "engine": engine,
+                "model": model
+            }
+        )
+        return response.json()
+
+    async def retrieve(self, request_id: str) -> Dict[str, Any]:
+        """
+        Retrieve the status and result of a video generation request. See
+        `Videos.retrieve`.
+        """
+        response = await self.client._transport.request(
+            "GET",
+            f"/v1/video/generation/status/{request_id}"
+        )
+        return response.json()
+
+    async def retrieve_many(self, request_ids: List[str], wait: float = 0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Retrieve the status of several video generation requests in one call.
+        See `Videos.retrieve_many`.
+        """
+        response = await self.client._transport.request(
+            "POST",
+            "/v1/video/generation/status",
+            json={
+                "requestIds": request_ids,
+                "wait": wait
+            }
+        )
+        return response.json()["jobs"]
+
+    async def wait(
+        self,
+        request_id: str,
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 15.0,
+        on_update: Optional[StatusCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Wait for a video generation request to finish. See `Videos.wait`.
+        """
+        results = await self.wait_many(
+            [request_id],
+            timeout=timeout,
+            poll_interval=poll_interval,
+            max_poll_interval=max_poll_interval,
+            on_update=on_update
+        )
+        return results[request_id]
+
+    async def wait_many(
+        self,
+        request_ids: List[str],
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 15.0,
+        on_update: Optional[StatusCallback] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Wait for video generation requests to finish. See `Videos.wait_many`.
+        """
+        state = WaitState(request_ids, timeout, PollInterval(poll_interval, max_poll_interval))
+        while True:
+            statuses = await self._poll(state.pending, state.get_long_poll_wait())
+            changed = state.update(statuses, on_update)
+            if not state.pending:
+                return state.get_results()
+            await asyncio.sleep(state.get_delay(changed))
+
+    async def _poll(self, request_ids: List[str], wait: float) -> Dict[str, Optional[Dict[str, Any]]]:
+        if self.client._supports_batch_status is not False:
+            try:
+                batches = await asyncio.gather(*(
+                    self.retrieve_many(request_ids[i:i + STATUS_BATCH_SIZE], wait=wait)
+                    for i in range(0, len(request_ids), STATUS_BATCH_SIZE)
+                ))
+                self.client._supports_batch_status = True
+                return {request_id: status for batch in batches for request_id, status in batch.items()}
+            except httpx.HTTPStatusError as e:
+                # APIs without the batch status endpoint
+                if self.client._supports_batch_status or e.response.status_code not in (404, 405):
+                    raise
+                self.client._supports_batch_status = False
+        statuses = await asyncio.gather(*(self.retrieve(request_id) for request_id in request_ids))
+        return dict(zip(request_ids, statuses))
+
+    async def export(self, scenes: list, title_slug: str) -> Dict[str, Any]:
+        """
+        Export multiple scenes into a single video. See `Videos.export`.
+        """
+        response = await self.client._transport.request(
+            "POST",
+            "/v1/video/exporting",
             json={
                 "scenes": scenes,
                 "titleSlug": title_slug
             }
         )
-        response.raise_for_status()
-        return response.json() 
\ No newline at end of file
+        return response.json()
@@ -0,0 +1,99 @@
+"""
+Progress events of streamed renders.
+
+With `stream: true`, the rendering endpoint sends one JSON object per line
+as the render goes: the progress of each animation, then the video URL (or
+the draft of a progressive render), or an error.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+
+class RenderError(Exception):
+    """
+    A render failed, as reported in its progress stream.
+    """
+
+
+@dataclass
+class RenderEvent:
+    """
+    An event of a streamed render.
+
+    `type` is one of:
+    - "progress": `animation_index` is being rendered, at `percentage`.
+    - "completed": the video is available at `video_url`.
+    - "draft": a progressive render's draft is at `draft_url`, and the final
+      video is rendered by the generation job `request_id`.
+    - "error": the render failed with `error`.
+    """
+
+    type: str
+    animation_index: Optional[int] = None
+    percentage: Optional[int] = None
+    video_url: Optional[str] = None
+    draft_url: Optional[str] = None
+    request_id: Optional[str] = None
+    error: Optional[str] = None
+    # The event as sent by the API
+    data: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RenderEvent":
+        if "error" in data:
+            event_type = "error"
+        elif "video_url" in data:
+            event_type = "completed"
+        elif "draft_url" in data:
+            event_type = "draft"
+        else:
+            event_type = "progress"
+        return cls(
+            type=event_type,
+            animation_index=data.get("animationIndex"),
+            percentage=data.get("percentage"),
+            video_url=data.get("video_url"),
+            draft_url=data.get("draft_url"),
+            request_id=data.get("request_id"),
+            error=data.get("error"),
+            data=data,
+        )
+
+
+EventCallback = Callable[[RenderEvent], None]
+
+
+def parse_event_line(line: Union[str, bytes]) -> Optional[RenderEvent]:
+    """
+    Parses a line of the progress stream, or returns None for blank lines.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    # Also accept server-sent events framing
+    if line.startswith("data:"):
+        line = line[len("data:"):].strip()
+    if not line:
+        return None
+    return RenderEvent.from_dict(json.loads(line))
+
+
+def get_render_result(events: Iterable[RenderEvent]) -> Dict[str, Any]:
+    """
+    Consumes the events of a render, and returns the same response as a
+    render without streaming. Raises `RenderError` if the render failed.
+    """
+    result = {"message": "Video generation completed, but no URL was found"}
+    for event in events:
+        if event.type == "error":
+            raise RenderError(event.error)
+        if event.type == "completed":
+            result = {"message": "Video generation completed", "video_url": event.video_url}
+        elif event.type == "draft":
+            result = {
+                "message": "Draft video generated, the final video is rendering",
+                **event.data,
+            }
+    return result
@@ -0,0 +1,218 @@
+"""
+HTTP transports shared by the resources of a client: `Transport` for
+`Animo`, on requests, and `AsyncTransport` for `AsyncAnimo`, on httpx. Both
+follow the same retry policy.
+
+`timeout` is how long a response may take by default; a request can set
+its own, like renders that wait for the video (None for no limit).
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional, Union
+
+import httpx
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Status codes worth retrying: rate limited, or a server-side failure
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Timeout of the requests that don't set their own: the client's
+DEFAULT_TIMEOUT = object()
+
+
+def get_retry_delay(
+    attempt: int,
+    retry_after: Optional[str] = None,
+    backoff: float = 0.5,
+    max_backoff: float = 30.0,
+) -> float:
+    """
+    Returns how long to wait before the next attempt: the Retry-After of the
+    response when it has one, otherwise exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), max_backoff)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+
+
+def should_retry(method: str, status_code: int) -> bool:
+    """
+    Whether a response is worth retrying. Requests that aren't idempotent
+    are only retried when they were rate limited, so weren't processed.
+    """
+    return status_code == 429 or (
+        method in IDEMPOTENT_METHODS and status_code in RETRY_STATUS_CODES
+    )
+
+
+def is_connect_error(error: requests.RequestException) -> bool:
+    """
+    Whether the connection couldn't be made, so the request wasn't sent.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+class Transport:
+    """
+    A pooled `requests.Session` with timeouts and retries.
+
+    Connections are kept alive and reused by every request of the client.
+    Requests are retried on connection errors and on 429 and 5xx responses,
+    with exponential backoff and jitter. Requests that aren't idempotent
+    (like POST) are only retried when the server can't have processed them:
+    on a 429, or when the connection couldn't be made.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: float = 300.0,
+        connect_timeout: float = 10.0,
+        max_retries: int = 3,
+        pool_size: int = 10,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        json: Union[Dict[str, Any], None] = None,
+        params: Union[Dict[str, Any], None] = None,
+        stream: bool = False,
+        timeout: Union[float, None, object] = DEFAULT_TIMEOUT,
+    ) -> requests.Response:
+        """
+        Sends a request to the API and returns its response. Raises
+        `requests.HTTPError` if it still fails after the retries.
+        """
+        method = method.upper()
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    json=json,
+                    params=params,
+                    timeout=(self.connect_timeout, timeout),
+                    stream=stream,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A request that failed after it was sent may have been processed
+                retryable = method in IDEMPOTENT_METHODS or is_connect_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                time.sleep(get_retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if not should_retry(method, response.status_code) or attempt >= self.max_retries:
+                response.raise_for_status()
+                return response
+            response.close()
+            time.sleep(get_retry_delay(attempt, response.headers.get("Retry-After")))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncTransport:
+    """
+    The asyncio counterpart of `Transport`, on a pooled `httpx.AsyncClient`.
+    Raises `httpx.HTTPStatusError` on error responses.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: float = 300.0,
+        connect_timeout: float = 10.0,
+        max_retries: int = 3,
+        pool_size: int = 100,
+    ):
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        # Requests wait for a free connection of the pool instead of failing
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout, pool=None),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        json: Union[Dict[str, Any], None] = None,
+        params: Union[Dict[str, Any], None] = None,
+        stream: bool = False,
+        timeout: Union[float, None, object] = DEFAULT_TIMEOUT,
+    ) -> httpx.Response:
+        """
+        Sends a request to the API and returns its response. Raises
+        `httpx.HTTPStatusError` if it still fails after the retries.
+
+        With `stream`, the body isn't read: the caller must iterate it and
+        close the response.
+        """
+        method = method.upper()
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.client.timeout
+        else:
+            timeout = httpx.Timeout(timeout, connect=self.connect_timeout, pool=None)
+        attempt = 0
+        while True:
+            try:
+                request = self.client.build_request(
+                    method, f"{self.base_url}{path}", json=json, params=params, timeout=timeout
+                )
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                # A request that failed after it was sent may have been processed
+                retryable = method in IDEMPOTENT_METHODS or isinstance(
+                    e, (httpx.ConnectError, httpx.ConnectTimeout)
+                )
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(get_retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if not should_retry(method, response.status_code) or attempt >= self.max_retries:
+                if response.is_error:
+                    await response.aclose()
+                response.raise_for_status()
+                return response
+            await response.aclose()
+            await asyncio.sleep(get_retry_delay(attempt, response.headers.get("Retry-After")))
+            attempt += 1
+
+    async def close(self):
+        await self.client.aclose()
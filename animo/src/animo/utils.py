@@ -0,0 +1,29 @@
+import asyncio
+from typing import Any, Awaitable, Iterable, List
+
+
+async def gather_with_limit(
+    aws: Iterable[Awaitable[Any]],
+    limit: int = 10,
+    return_exceptions: bool = False
+) -> List[Any]:
+    """
+    Like `asyncio.gather`, but with at most `limit` awaitables running at the
+    same time.
+
+    Args:
+        aws (Iterable[Awaitable]): Coroutines to run, like `client.videos.generate(...)` calls
+        limit (int, optional): Maximum number running at the same time. Defaults to 10
+        return_exceptions (bool, optional): Return exceptions in the results
+            instead of raising the first one. Defaults to False
+
+    Returns:
+        List[Any]: The results, in the order of `aws`
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=return_exceptions)
@@ -4,6 +4,10 @@ from dotenv import load_dotenv
 from .routes.video_rendering import video_rendering_bp
 from .routes.code_generation import code_generation_bp
 from .routes.chat_generation import chat_generation_bp
+from .routes.video_generation import video_generation_bp
+from .routes.storage import storage_bp
+from .utils.llm_clients import get_llm_clients
+from .utils.render_pool import USE_RENDER_POOL, get_render_pool
 
 def create_app():
     app = Flask(__name__, static_folder="public", static_url_path="/public")
@@ -13,8 +17,17 @@ def create_app():
     app.register_blueprint(video_rendering_bp)
     app.register_blueprint(code_generation_bp)
     app.register_blueprint(chat_generation_bp)
+    app.register_blueprint(video_generation_bp)
+    app.register_blueprint(storage_bp)
 
     CORS(app)
+
+    # Shared by every request, so connections to the providers are reused
+    app.extensions["llm_clients"] = get_llm_clients()
+
+    if USE_RENDER_POOL:
+        # Start the warm render workers now, so the first render doesn't wait for them
+        get_render_pool()
     
     @app.route("/")
     def hello_world():
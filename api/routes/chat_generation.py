@@ -1,18 +1,12 @@
 from flask import Blueprint, jsonify, request, Response, stream_with_context
-import anthropic
-import openai
-import os
 import json
-import subprocess
-import shutil
-import string
-import random
-import re
-import base64
 from api.prompts.manimDocs import manimDocs
+from api.utils.conversation import ImageBudgetedConversation
+from api.utils.data_stream import DataStreamEncoder, encode_text_part
+from api.utils.llm_clients import LLMBusyError, get_llm_clients
+from api.utils.preview import get_preview
+from api.utils.preview_workspace import get_preview_workspace
 from azure.storage.blob import BlobServiceClient
-from PIL import Image
-import io
 import time
 from openai import APIError
 import uuid
@@ -20,6 +14,13 @@ import uuid
 chat_generation_bp = Blueprint("chat_generation", __name__)
 
 
+def get_busy_response(error: LLMBusyError):
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
 animo_functions = {
     "openai": [
         {
@@ -64,49 +65,6 @@ animo_functions = {
     ]
 }
 
-def count_images_in_conversation(messages):
-    """
-    Count the total number of images in the conversation.
-    Returns a tuple of (total_count, list of image messages indices)
-    """
-    total_images = 0
-    image_message_indices = []
-    
-    for i, message in enumerate(messages):
-        if message.get("role") == "user" and isinstance(message.get("content"), list):
-            image_count = sum(1 for content in message["content"] if isinstance(content, dict) and content.get("type") == "image_url")
-            if image_count > 0:
-                total_images += image_count
-                image_message_indices.append(i)
-    
-    return total_images, image_message_indices
-
-def manage_conversation_images(messages, new_images_count, engine):
-    """
-    Manage the conversation to ensure we don't exceed image limits.
-    For OpenAI, we maintain only the last 50 images.
-    Returns the maximum number of new images we can add.
-    """
-    if engine != "openai":
-        return len(new_images_count)  # No limit for other engines
-        
-    MAX_IMAGES = 50
-    current_total, image_indices = count_images_in_conversation(messages)
-    
-    # If we already have too many images, remove old image messages
-    while current_total > 0 and current_total + new_images_count > MAX_IMAGES and image_indices:
-        oldest_image_idx = image_indices[0]
-        removed_message = messages.pop(oldest_image_idx)
-        # Recount images in the removed message
-        removed_images = sum(1 for content in removed_message["content"] 
-                           if isinstance(content, dict) and content.get("type") == "image_url")
-        current_total -= removed_images
-        # Update indices after removal
-        image_indices = [idx - 1 for idx in image_indices[1:]]  # Adjust remaining indices
-    
-    # Return how many new images we can add
-    return min(MAX_IMAGES - current_total, new_images_count)
-
 @chat_generation_bp.route("/v1/chat/generation", methods=["POST"])
 def generate_code_chat():
     """
@@ -130,6 +88,9 @@ def generate_code_chat():
     model = data.get("model", None)  # Optional model parameter
     selected_scenes = data.get("selectedScenes", [])
     is_for_platform = data.get("isForPlatform", False)
+    # Previews of the same conversation only render the animations that changed
+    conversation_id = data.get("conversationId")
+    preview_workspace = get_preview_workspace(conversation_id) if conversation_id else None
 
     # Define default models for each engine
     ENGINE_DEFAULTS = {
@@ -325,113 +286,7 @@ That message should appear after the code, as the last message of the conversati
     messages.insert(0, {"role": "system", "content": general_system_prompt})
 
     if engine == "anthropic":
-        client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-
-        def get_preview(code: str, class_name: str):
-            """
-            get_preview is a function that generates PNGs frames from a Manim script animation.
-            
-            IMPORTANT: This version of the function will only work for OpenAI models.
-            """
-            
-            print("Generating preview")
-
-            # Get the absolute path of the current script (in api/routes)
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            api_dir = os.path.dirname(current_dir)  # This should be the /api directory
-            
-            # Create the temporary directory inside /api
-            temp_dir = os.path.join(api_dir, "temp_manim")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Create the Python file in the temporary location
-            file_name = f"{class_name}.py"
-            file_path = os.path.join(temp_dir, file_name)
-            
-            preview_code = f"""
-from manim import *
-from math import *
-
-{code}
-            """
-            
-            with open(file_path, "w") as f:
-                f.write(preview_code)
-            
-            # Run the Manim command
-            command = f"manim {file_path} {class_name} --format=png --media_dir {temp_dir} --custom_folders -pql --disable_caching"
-            try:
-                result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-                
-                print(f"Result: {result}")
-                
-                # Create the previews directory if it doesn't exist
-                previews_dir = os.path.join(api_dir, "public", "previews")
-                os.makedirs(previews_dir, exist_ok=True)
-
-                # Generate a random string for the subfolder
-                random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
-                
-                # Move the generated PNGs to the previews directory
-                source_dir = temp_dir
-                destination_dir = os.path.join(previews_dir, random_string, class_name)
-                
-                # Find all PNG files in the source directory
-                png_files = [f for f in os.listdir(source_dir) if f.endswith('.png')]
-                
-                if png_files:
-                    os.makedirs(destination_dir, exist_ok=True)
-                    image_list = []
-                    for png_file in png_files:
-                        shutil.move(os.path.join(source_dir, png_file), os.path.join(destination_dir, png_file))
-                        # Extract the index from the filename
-                        match = re.search(r'(\d+)\.png$', png_file)
-                        if match:
-                            index = int(match.group(1))
-                            if index % 4 == 0:  # Only include frames where index is divisible by 5
-                                image_path = os.path.join(destination_dir, png_file)
-                                with Image.open(image_path) as img:
-                                    # Calculate new dimensions (half the original size)
-                                    width, height = img.size
-                                    new_width = width // 4
-                                    new_height = height // 4
-                                    # Resize the image
-                                    resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                                    # Save the resized image to a bytes buffer
-                                    buffer = io.BytesIO()
-                                    resized_img.save(buffer, format="PNG")
-                                    # Get the base64 encoding of the resized image
-                                    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                                image_list.append({
-                                    "path": image_path,
-                                    "index": index,
-                                    "base64": base64_image
-                                })
-                    image_list.sort(key=lambda x: x["index"])
-                    return json.dumps({
-                        "message": f"Animation preview generated. Now you will see the image frames in the next automatic message...",
-                        "images": image_list
-                    })
-                else:
-                    print(f"No PNG files found in: {source_dir}")
-                    return json.dumps({
-                        "error": f"No preview files generated at expected location: {source_dir}",
-                        "images": []
-                    })
-            except subprocess.CalledProcessError as e:
-                error_output = e.stdout + e.stderr
-                print(f"Error running Manim command: {str(e)}")
-                print(f"Command output:\n{error_output}")
-                return json.dumps({
-                    "error": f"ERROR. Error generating preview, please think on what could be the problem, and use `get_preview` to run the code again: {str(e)}\nCommand output:\n{error_output}",
-                    "images": []
-                })
-            except Exception as e:
-                print(f"Unexpected error: {str(e)}")
-                return json.dumps({
-                    "error": f"Unexpected error: {str(e)}",
-                    "images": []
-                })
+        llm_clients = get_llm_clients()
 
         def convert_message_for_anthropic(message):
             if isinstance(message["content"], list):
@@ -456,9 +311,36 @@ from math import *
             if msg["role"] != "system"
         ]
 
+        def open_stream():
+            return llm_clients.stream(
+                "anthropic",
+                llm_clients.anthropic.messages.create,
+                model="claude-3-5-sonnet-20241022",
+                messages=anthropic_messages,
+                system=system_message,
+                max_tokens=1000,
+                stream=True,
+                tools=animo_functions["anthropic"]
+            )
+
+        # The first request is started here, so a busy engine gets a 503.
+        # Its other errors are sent in the stream, like those of later requests.
+        first_stream, first_error = None, None
+        try:
+            first_stream = open_stream()
+        except LLMBusyError as e:
+            return get_busy_response(e)
+        except Exception as e:
+            first_error = e
+
         def generate():
+            encoder = DataStreamEncoder()
+            stream = first_stream
             try:
+                if first_error:
+                    raise first_error
                 messages = anthropic_messages
+                conversation = ImageBudgetedConversation(messages, engine)
                 while True:
                     print("\n=== Starting new message stream ===")
                     print("=== Current message history ===")
@@ -478,14 +360,8 @@ from math import *
                             print(f"Content: {msg['content']}")
                     print("\n=== End of message history ===")
                     
-                    stream = client.messages.create(
-                        model="claude-3-5-sonnet-20241022",
-                        messages=messages,
-                        system=system_message,
-                        max_tokens=1000,
-                        stream=True,
-                        tools=animo_functions["anthropic"]
-                    )
+                    if stream is None:
+                        stream = open_stream()
                     
                     current_message = {"role": "assistant", "content": []}
                     current_text = ""  # To accumulate text content
@@ -494,7 +370,15 @@ from math import *
                     tool_use_id = None
                     complete_json = ""
                     
-                    for chunk in stream:
+                    # The request slot is freed once the stream is read,
+                    # which goes on while a preview renders
+                    chunks = encoder.iter_with_flushes(stream)
+                    stream = None
+                    for chunk in chunks:
+                        if isinstance(chunk, str):
+                            # Buffered text, sent while the model pauses
+                            yield chunk
+                            continue
                         print(f"\nChunk type: {chunk.type}")
                         print(f"Chunk content: {chunk}")
                         
@@ -534,9 +418,7 @@ from math import *
                                     print(f"Text content: {content}")
                                     current_text += content  # Accumulate text
                                     if is_for_platform:
-                                        for char in content:
-                                            escaped_char = repr(char)[1:-1]
-                                            yield f'0:"{escaped_char}"\n'
+                                        yield from encoder.text(content)
                                     else:
                                         yield content
                                 
@@ -546,6 +428,8 @@ from math import *
 
                         elif chunk.type == "content_block_stop":
                             if complete_json:
+                                # Send the pending text before the preview is rendered
+                                yield from encoder.flush()
                                 try:
                                     print("\n=== Processing tool call ===")
                                     tool_call = json.loads(complete_json)
@@ -554,7 +438,8 @@ from math import *
                                     
                                     preview_result = get_preview(
                                         code=tool_call.get('code', ''),
-                                        class_name=tool_call.get('class_name', '')
+                                        class_name=tool_call.get('class_name', ''),
+                                        workspace=preview_workspace
                                     )
                                     
                                     try:
@@ -576,7 +461,7 @@ from math import *
                                                 "type": "image",
                                                 "source": {
                                                     "type": "base64",
-                                                    "media_type": "image/png",
+                                                    "media_type": middle_frame.get("media_type", "image/png"),
                                                     "data": base64_data  # Use raw base64 without prefix
                                                 }
                                             },
@@ -598,17 +483,17 @@ from math import *
                                         print(f"\nTool response structure:")
                                         print(json.dumps(tool_response, indent=2))
                                         
-                                        # Add the assistant's message with tool use before adding tool result
-                                        messages.append(current_message)
-                                        messages.append(tool_response)
+                                        # Add the assistant's message with tool use before adding tool result,
+                                        # compacting older previews if the new frame doesn't fit
+                                        conversation.make_room(1)
+                                        conversation.append(current_message)
+                                        conversation.append(tool_response)
                                         should_continue = True
                                         
                                         preview_text = "Generated preview of the animation:\n"
                                         if is_for_platform:
-                                            for char in preview_text:
-                                                escaped_char = repr(char)[1:-1]
-                                                yield f'0:"{escaped_char}"\n'
-                                            yield f'0:"[IMAGE: Preview frame]"\n'
+                                            yield encode_text_part(preview_text)
+                                            yield encode_text_part("[IMAGE: Preview frame]")
                                         else:
                                             yield "\n[Preview frame]\n"
                                         
@@ -623,6 +508,7 @@ from math import *
                         
                         elif chunk.type == "message_stop":
                             print("\n=== Message stream ended ===")
+                            yield from encoder.flush()
                             # Add any remaining text content
                             if current_text:
                                 if not current_message["content"]:
@@ -631,7 +517,7 @@ from math import *
                                     "type": "text",
                                     "text": current_text
                                 })
-                                messages.append(current_message)
+                                conversation.append(current_message)
                             
                             if not should_continue:
                                 return
@@ -640,10 +526,16 @@ from math import *
                     if not should_continue:
                         break
 
+                # Text buffered when the stream ended without a message_stop
+                yield from encoder.flush()
+
             except Exception as e:
                 print(f"\n=== Error occurred ===\nError details: {str(e)}")
-                error_message = f'0:"{str(e)}"\n' if is_for_platform else f"Error: {str(e)}"
-                yield error_message
+                if is_for_platform:
+                    yield from encoder.flush()
+                    yield encode_text_part(str(e))
+                else:
+                    yield f"Error: {str(e)}"
 
         response = Response(stream_with_context(generate()), content_type="text/plain; charset=utf-8" if is_for_platform else "text/event-stream")
         if is_for_platform:
@@ -652,131 +544,44 @@ from math import *
         return response
 
     else:
-        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-                
-        def get_preview(code: str, class_name: str):
-            """
-            get_preview is a function that generates PNGs frames from a Manim script animation.
-            
-            IMPORTANT: This version of the function will only work for OpenAI models.
-            """
-            
-            print("Generating preview")
-
-            # Get the absolute path of the current script (in api/routes)
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            api_dir = os.path.dirname(current_dir)  # This should be the /api directory
-            
-            # Create the temporary directory inside /api
-            temp_dir = os.path.join(api_dir, "temp_manim")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Create the Python file in the temporary location
-            file_name = f"{class_name}.py"
-            file_path = os.path.join(temp_dir, file_name)
-            
-            preview_code = f"""
-from manim import *
-from math import *
-
-{code}
-            """
-            
-            with open(file_path, "w") as f:
-                f.write(preview_code)
-            
-            # Run the Manim command
-            command = f"manim {file_path} {class_name} --format=png --media_dir {temp_dir} --custom_folders -pql --disable_caching"
-            try:
-                result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-                
-                print(f"Result: {result}")
-                
-                # Create the previews directory if it doesn't exist
-                previews_dir = os.path.join(api_dir, "public", "previews")
-                os.makedirs(previews_dir, exist_ok=True)
-
-                # Generate a random string for the subfolder
-                random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
-                
-                # Move the generated PNGs to the previews directory
-                source_dir = temp_dir
-                destination_dir = os.path.join(previews_dir, random_string, class_name)
-                
-                # Find all PNG files in the source directory
-                png_files = [f for f in os.listdir(source_dir) if f.endswith('.png')]
-                
-                if png_files:
-                    os.makedirs(destination_dir, exist_ok=True)
-                    image_list = []
-                    for png_file in png_files:
-                        shutil.move(os.path.join(source_dir, png_file), os.path.join(destination_dir, png_file))
-                        # Extract the index from the filename
-                        match = re.search(r'(\d+)\.png$', png_file)
-                        if match:
-                            index = int(match.group(1))
-                            if index % 4 == 0:  # Only include frames where index is divisible by 5
-                                image_path = os.path.join(destination_dir, png_file)
-                                with Image.open(image_path) as img:
-                                    # Calculate new dimensions (half the original size)
-                                    width, height = img.size
-                                    new_width = width // 4
-                                    new_height = height // 4
-                                    # Resize the image
-                                    resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                                    # Save the resized image to a bytes buffer
-                                    buffer = io.BytesIO()
-                                    resized_img.save(buffer, format="PNG")
-                                    # Get the base64 encoding of the resized image
-                                    base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                                image_list.append({
-                                    "path": image_path,
-                                    "index": index,
-                                    "base64": base64_image
-                                })
-                    image_list.sort(key=lambda x: x["index"])
-                    return json.dumps({
-                        "message": f"Animation preview generated. Now you will see the image frames in the next automatic message...",
-                        "images": image_list
-                    })
-                else:
-                    print(f"No PNG files found in: {source_dir}")
-                    return json.dumps({
-                        "error": f"No preview files generated at expected location: {source_dir}",
-                        "images": []
-                    })
-            except subprocess.CalledProcessError as e:
-                error_output = e.stdout + e.stderr
-                print(f"Error running Manim command: {str(e)}")
-                print(f"Command output:\n{error_output}")
-                return json.dumps({
-                    "error": f"ERROR. Error generating preview, please think on what could be the problem, and use `get_preview` to run the code again: {str(e)}\nCommand output:\n{error_output}",
-                    "images": []
-                })
-            except Exception as e:
-                print(f"Unexpected error: {str(e)}")
-                return json.dumps({
-                    "error": f"Unexpected error: {str(e)}",
-                    "images": []
-                })
+        llm_clients = get_llm_clients()
+
+        def open_stream():
+            return llm_clients.stream(
+                "openai",
+                llm_clients.openai.chat.completions.create,
+                model="gpt-4o",
+                messages=messages,
+                stream=True,
+                functions=animo_functions["openai"],
+                function_call="auto",
+            )
+
+        # The first request is started here, so a busy engine gets a 503.
+        # On API errors, it's retried in the stream like later requests.
+        first_stream = None
+        try:
+            first_stream = open_stream()
+        except LLMBusyError as e:
+            return get_busy_response(e)
+        except APIError as e:
+            print(f"APIError occurred: {str(e)}. Retrying in the stream...")
 
         def generate():
             max_retries = 3
             retry_delay = 4  # seconds
+            conversation = ImageBudgetedConversation(messages, engine)
+            stream = first_stream
 
             while True:
                 for attempt in range(max_retries):
                     try:
-                        stream = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=messages,
-                            stream=True,
-                            functions=animo_functions["openai"],
-                            function_call="auto",
-                        )
+                        if stream is None:
+                            stream = open_stream()
+                        chunks, stream = stream, None
                         function_call_data = ""
                         function_name = ""
-                        for chunk in stream:
+                        for chunk in chunks:
                             if chunk.choices[0].delta.content:
                                 content = chunk.choices[0].delta.content
                                 if is_for_platform:
@@ -808,6 +613,9 @@ from math import *
                         # If we get here, the stream completed successfully
                         break
                     
+                    except LLMBusyError as e:
+                        yield json.dumps({"error": str(e)})
+                        return
                     except APIError as e:
                         if attempt < max_retries - 1:
                             print(f"APIError occurred: {str(e)}. Retrying in {retry_delay} seconds...")
@@ -819,7 +627,7 @@ from math import *
 
                 if function_call_data:
                     # Add the function call to messages
-                    messages.append({
+                    conversation.append({
                         "role": "assistant",
                         "content": None,
                         "function_call": {
@@ -848,14 +656,14 @@ from math import *
                     if function_name == "get_preview":
                         print(f"Calling get_preview with data: {function_call_data}")
                         args = json.loads(function_call_data)
-                        result = get_preview(args['code'], args['class_name'])
+                        result = get_preview(args['code'], args['class_name'], workspace=preview_workspace)
                         result_json = json.loads(result)
                         function_response = {
                             "content": result_json.get("message", result_json.get("error")),
                             "name": "get_preview",
                             "role": "function"
                         }
-                        messages.append(function_response)
+                        conversation.append(function_response)
 
                         # Yield the function response back to the frontend
                         if is_for_platform:
@@ -868,8 +676,13 @@ from math import *
                         else:
                             pass
 
-                        # Only create and send image_message if there are images
+                        # Calculate how many new images we can add, compacting older previews if needed
+                        available_slots = 0
                         if result_json.get("images"):
+                            available_slots = conversation.make_room(len(result_json["images"]))
+
+                        # Only create and send image_message if there are images
+                        if available_slots:
                             # Create a new message with the images
                             image_message = {
                                 "role": "user",
@@ -885,9 +698,6 @@ from math import *
                                 ]
                             }
 
-                            # Calculate how many new images we can add
-                            available_slots = manage_conversation_images(messages, len(result_json["images"]), engine)
-                            
                             # Select frames based on available slots
                             total_frames = len(result_json["images"])
                             frame_interval = max(1, total_frames // available_slots)
@@ -897,10 +707,10 @@ from math import *
                                 image_message["content"].append({
                                     "type": "image_url",
                                     "image_url": {
-                                        "url": f"data:image/png;base64,{image['base64']}"
+                                        "url": f"data:{image.get('media_type', 'image/png')};base64,{image['base64']}"
                                     }
                                 })
-                            messages.append(image_message)
+                            conversation.append(image_message)
 
                             # Yield the image message back to the frontend
                             image_message_obj = json.dumps(image_message)
@@ -1,17 +1,10 @@
 from flask import Blueprint, jsonify, request
-import anthropic
-import os
-from openai import OpenAI
+from api.utils.code_cache import USE_CODE_CACHE, get_code_cache, get_code_cache_key
+from api.utils.llm_clients import LLMBusyError, get_llm_clients
 
 code_generation_bp = Blueprint('code_generation', __name__)
 
-@code_generation_bp.route('/v1/code/generation', methods=['POST'])
-def generate_code():
-    body = request.json
-    prompt_content = body.get("prompt", "")
-    model = body.get("model", "gpt-4o")
-
-    general_system_prompt = """
+GENERAL_SYSTEM_PROMPT = """
 You are an assistant that knows about Manim. Manim is a mathematical animation engine that is used to create videos programmatically.
 
 The following is an example of the code:
@@ -33,43 +26,82 @@ def construct(self):
 4. Do not explain the code, only the code.
     """
 
-    if model.startswith("claude-"):
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        messages = [{"role": "user", "content": prompt_content}]
-        try:
-            response = client.messages.create(
-                model=model,
-                max_tokens=1000,
-                temperature=0.2,
-                system=general_system_prompt,
-                messages=messages,
-            )
 
-            # Extract the text content from the response
-            code = "".join(block.text for block in response.content)
+# Model used by each engine when none is given
+DEFAULT_ENGINE_MODELS = {
+    "openai": "gpt-4o",
+    "anthropic": "claude-3-5-sonnet-20241022",
+}
 
-            return jsonify({"code": code})
 
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
+def get_model_engine(model: str) -> str:
+    """
+    Returns the engine that serves a model.
+    """
+    return "anthropic" if model.startswith("claude-") else "openai"
 
-    else:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        messages = [
-            {"role": "system", "content": general_system_prompt},
-            {"role": "user", "content": prompt_content},
-        ]
 
-        try:
-            response = client.chat.completions.create(
+def generate_manim_code(prompt_content: str, model: str = "gpt-4o") -> str:
+    """
+    Generates Manim code for a prompt with OpenAI or Anthropic, depending on the model.
+    """
+    llm_clients = get_llm_clients()
+    if get_model_engine(model) == "anthropic":
+        messages = [{"role": "user", "content": prompt_content}]
+        with llm_clients.limit("anthropic"):
+            response = llm_clients.anthropic.messages.create(
                 model=model,
-                messages=messages,
+                max_tokens=1000,
                 temperature=0.2,
+                system=GENERAL_SYSTEM_PROMPT,
+                messages=messages,
             )
 
-            code = response.choices[0].message.content
+        # Extract the text content from the response
+        return "".join(block.text for block in response.content)
+
+    messages = [
+        {"role": "system", "content": GENERAL_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt_content},
+    ]
+    with llm_clients.limit("openai"):
+        response = llm_clients.openai.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.2,
+        )
+    return response.choices[0].message.content
 
-            return jsonify({"code": code})
 
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
+@code_generation_bp.route('/v1/code/generation', methods=['POST'])
+def generate_code():
+    body = request.json
+    prompt_content = body.get("prompt", "")
+    model = body.get("model", "gpt-4o")
+
+    cache_key = None
+    if USE_CODE_CACHE and prompt_content:
+        cache_key = get_code_cache_key(prompt_content, model, GENERAL_SYSTEM_PROMPT)
+        # `Cache-Control: no-cache` asks for a fresh answer, which then replaces the cached one
+        if "no-cache" not in request.headers.get("Cache-Control", ""):
+            code = get_code_cache().get(cache_key)
+            if code is not None:
+                response = jsonify({"code": code})
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+    try:
+        code = generate_manim_code(prompt_content, model)
+    except LLMBusyError as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if cache_key and code:
+        get_code_cache().put(cache_key, code)
+    response = jsonify({"code": code})
+    response.headers["X-Cache"] = "MISS" if cache_key else "BYPASS"
+    return response
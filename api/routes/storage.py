@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify, redirect, send_file
+
+from api.utils.storage import TieredStorage, get_storage
+
+storage_bp = Blueprint("storage", __name__)
+
+
+@storage_bp.route("/v1/storage/<path:name>", methods=["GET"])
+def get_stored_file(name: str):
+    """
+    Serves a file of the tiered storage: from the local cache when it's still
+    there, otherwise by redirecting to its Azure Blob Storage URL.
+    """
+    storage = get_storage()
+    if not isinstance(storage, TieredStorage):
+        return jsonify({"error": "Not found"}), 404
+
+    try:
+        local_path = storage.hot.get_local_path(name)
+    except ValueError:
+        return jsonify({"error": "Invalid file name"}), 400
+    if local_path:
+        return send_file(local_path, mimetype="video/mp4", conditional=True)
+    print(f"{name} is no longer cached locally, redirecting to Azure")
+    return redirect(storage.cold.get_url(name), code=302)
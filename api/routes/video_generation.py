@@ -0,0 +1,328 @@
+from flask import Blueprint, jsonify, request
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Union
+from api.routes.code_generation import DEFAULT_ENGINE_MODELS, generate_manim_code, get_model_engine
+from api.routes.video_rendering import render_scene
+from api.utils.code_validation import CodeValidationError, validate_scene_code
+from api.utils.job_queue import FINISHED_STATUSES, JobScheduler, JobStore, QueueFullError
+from api.utils.render_profiles import get_api_key, get_render_profile
+
+video_generation_bp = Blueprint("video_generation", __name__)
+
+# Minimum time between two progress updates written to the job store
+PROGRESS_UPDATE_INTERVAL = 0.5
+# Longest a status request waits for jobs to finish (long polling)
+STATUS_MAX_WAIT_SECONDS = float(os.getenv("STATUS_MAX_WAIT_SECONDS", "30"))
+STATUS_BATCH_MAX_IDS = 100
+# Statuses of the job store, and their name in the API
+PUBLIC_STATUSES = {
+    "queued": "PENDING",
+    "running": "PROCESSING",
+    "completed": "SUCCEEDED",
+    "failed": "FAILED",
+}
+
+
+def extract_code(text: str) -> str:
+    """
+    Extracts the code from a ``` ``` block of a model response, if there is one.
+    """
+    match = re.search(r"```(?:python)?\n?(.*?)```", text, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    return text
+
+
+def run_generation_job(job: dict, store: JobStore) -> Union[dict, Future]:
+    """
+    Generates the code of a job (unless it was given) and renders it.
+
+    When the video is uploaded in the background, returns a `Future` of the
+    result, so the worker can start rendering the next job meanwhile.
+    """
+    job_request = job["request"]
+    code = job_request.get("code")
+    if not code:
+        store.update(job["id"], progress={"stage": "generating_code"})
+        code = extract_code(
+            generate_manim_code(job_request["prompt"], job_request.get("model") or "gpt-4o")
+        )
+
+    code = validate_scene_code(code, job_request.get("file_class"))
+
+    # Progressive jobs render a draft first. Jobs queued by a progressive
+    # render of `/v1/video/rendering` already have theirs.
+    draft_url = job_request.get("draft_url")
+    if job_request.get("progressive") and not draft_url:
+        draft_url = render_job_video(job, store, code, "rendering_draft", draft=True)
+
+    progress = {"draft_url": draft_url} if draft_url else {}
+    video = render_job_video(
+        job, store, code, "rendering", progress=progress, wait_for_upload=False
+    )
+    if not isinstance(video, Future):
+        return {"video_url": video, "code": code, **progress}
+
+    store.update(job["id"], progress={"stage": "uploading", **progress})
+    result = Future()
+
+    def set_result(upload: Future):
+        try:
+            result.set_result({"video_url": upload.result(), "code": code, **progress})
+        except Exception as e:
+            result.set_exception(e)
+
+    video.add_done_callback(set_result)
+    return result
+
+
+def render_job_video(
+    job: dict,
+    store: JobStore,
+    code: str,
+    stage: str,
+    draft: bool = False,
+    progress: Union[dict, None] = None,
+    wait_for_upload: bool = True,
+) -> Union[str, Future]:
+    """
+    Renders the video of a job, keeping its progress up to date, and returns
+    the video URL (or a `Future` of it, without `wait_for_upload`).
+    """
+    job_request = job["request"]
+    progress = progress or {}
+    video_url = None
+    last_update = 0
+    events = render_scene(
+        code,
+        job_request.get("file_class"),
+        job_request.get("aspect_ratio"),
+        f"video-{job['user_id']}-{job['id']}",
+        job_request.get("base_url"),
+        draft=draft,
+        profile=get_render_profile(job_request.get("profile")),
+        wait_for_upload=wait_for_upload,
+    )
+    for event in events:
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        if "video_upload" in event:
+            return event["video_upload"]
+        if "video_url" in event:
+            video_url = event["video_url"]
+        elif time.time() - last_update >= PROGRESS_UPDATE_INTERVAL:
+            last_update = time.time()
+            store.update(job["id"], progress={"stage": stage, **progress, **event})
+
+    if not video_url:
+        raise RuntimeError("Video generation completed, but no URL was found")
+    if draft:
+        store.update(job["id"], progress={"stage": stage, "draft_url": video_url})
+    return video_url
+
+
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    """
+    Returns the process-wide job scheduler, starting it on first use.
+    """
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            _job_scheduler = JobScheduler(JobStore(), run_generation_job)
+        return _job_scheduler
+
+
+@video_generation_bp.route("/v1/video/generation", methods=["POST"])
+def create_generation_job():
+    """
+    Queues the generation of a video, from a prompt or from code, and returns
+    the `requestId` to check its status with
+    `/v1/video/generation/status/<request_id>`.
+    """
+    body = request.json
+    prompt = body.get("prompt")
+    code = body.get("code")
+
+    if not prompt and not code:
+        return jsonify(error="No prompt or code provided"), 400
+
+    if code:
+        # Fail fast on code that can't render, instead of queuing it
+        try:
+            code = validate_scene_code(code, body.get("file_class"))
+        except CodeValidationError as e:
+            return jsonify(error=str(e)), 400
+
+    # The engine picks the default model, and must serve the given one
+    engine = body.get("engine")
+    model = body.get("model")
+    if engine is not None and engine not in DEFAULT_ENGINE_MODELS:
+        return jsonify(error=f"Invalid engine. Must be one of: {', '.join(DEFAULT_ENGINE_MODELS)}"), 400
+    if engine and model and get_model_engine(model) != engine:
+        return jsonify(error=f"Model '{model}' is not served by the '{engine}' engine"), 400
+    model = model or DEFAULT_ENGINE_MODELS[engine or "openai"]
+
+    try:
+        priority = int(body.get("priority", 0))
+    except (TypeError, ValueError):
+        return jsonify(error="Priority must be an integer"), 400
+
+    try:
+        profile = get_render_profile(body.get("profile"), get_api_key(request.headers))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    user_id = body.get("user_id") or str(uuid.uuid4())
+    job_request = {
+        "prompt": prompt,
+        "code": code,
+        "model": model,
+        "file_class": body.get("file_class"),
+        "aspect_ratio": body.get("aspect_ratio"),
+        "base_url": request.host_url,
+        "progressive": bool(body.get("progressive", False)),
+        "profile": profile["name"],
+    }
+
+    try:
+        job = get_job_scheduler().submit(user_id, job_request, priority)
+    except QueueFullError as e:
+        return jsonify(error=str(e)), 429
+
+    return (
+        jsonify(
+            {
+                "message": "Your request has been submitted and is being processed.",
+                "requestId": job["id"],
+                "status": get_public_status(job),
+            }
+        ),
+        202,
+    )
+
+
+def get_public_status(job: dict) -> str:
+    """
+    Returns the status of a job as documented for the Animo API: PENDING,
+    PROCESSING, RENDERED (uploading the video), SUCCEEDED or FAILED.
+    """
+    if job["status"] == "running" and (job["progress"] or {}).get("stage") == "uploading":
+        return "RENDERED"
+    return PUBLIC_STATUSES[job["status"]]
+
+
+def format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def get_job_status(job: dict) -> dict:
+    """
+    Returns the status of a job, as sent to clients.
+    """
+    result = job["result"] or {}
+    draft_url = (
+        result.get("draft_url")
+        or (job["progress"] or {}).get("draft_url")
+        or job["request"].get("draft_url")
+    )
+    processing_time = None
+    if job["status"] in FINISHED_STATUSES:
+        processing_time = round(job["updated_at"] - job["created_at"], 1)
+    return {
+        "requestId": job["id"],
+        "status": get_public_status(job),
+        "progress": job["progress"],
+        "draftUrl": draft_url,
+        "videoUrl": result.get("video_url"),
+        "generatedCode": result.get("code"),
+        "error": job["error"],
+        "processingTime": processing_time,
+        "createdAt": format_timestamp(job["created_at"]),
+        "updatedAt": format_timestamp(job["updated_at"]),
+    }
+
+
+def get_wait_seconds(value) -> float:
+    """
+    Parses the `wait` of a long-polling request, capped to
+    `STATUS_MAX_WAIT_SECONDS`. Raises `ValueError` if it isn't a number.
+    """
+    wait = float(value or 0)
+    if math.isnan(wait):
+        raise ValueError("Wait is not a number")
+    return min(max(wait, 0), STATUS_MAX_WAIT_SECONDS)
+
+
+def wait_for_jobs(store: JobStore, job_ids: list, wait: float) -> dict:
+    """
+    Returns the jobs of `job_ids` by ID, once one of them is finished (or
+    unknown), or after `wait` seconds.
+    """
+    deadline = time.time() + wait
+    while True:
+        jobs = store.get_many(job_ids)
+        remaining = deadline - time.time()
+        if remaining <= 0 or any(
+            job is None or job["status"] in FINISHED_STATUSES for job in jobs.values()
+        ):
+            return jobs
+        # Check again at least every second, for updates this process misses
+        store.wait_for_update(min(remaining, 1.0))
+
+
+@video_generation_bp.route("/v1/video/generation/status/<request_id>", methods=["GET"])
+def get_generation_status(request_id):
+    """
+    Returns the status of a job. With `?wait=<seconds>`, waits until the job
+    is finished, up to that long, before responding.
+    """
+    try:
+        wait = get_wait_seconds(request.args.get("wait"))
+    except ValueError:
+        return jsonify(error="Wait must be a number of seconds"), 400
+
+    job = wait_for_jobs(get_job_scheduler().store, [request_id], wait)[request_id]
+    if job is None:
+        return jsonify(error="Request not found"), 404
+    return jsonify(get_job_status(job))
+
+
+@video_generation_bp.route("/v1/video/generation/status", methods=["POST"])
+def get_generation_statuses():
+    """
+    Returns the status of several jobs, by ID, with null for unknown IDs.
+    With `wait` (in seconds), waits until one of the jobs is finished, up to
+    that long, before responding.
+    """
+    body = request.json or {}
+    request_ids = body.get("requestIds")
+    if not isinstance(request_ids, list) or not all(isinstance(i, str) for i in request_ids):
+        return jsonify(error="requestIds must be a list of request IDs"), 400
+    if len(request_ids) > STATUS_BATCH_MAX_IDS:
+        return jsonify(error=f"At most {STATUS_BATCH_MAX_IDS} request IDs per call"), 400
+
+    try:
+        wait = get_wait_seconds(body.get("wait"))
+    except (TypeError, ValueError):
+        return jsonify(error="Wait must be a number of seconds"), 400
+
+    jobs = wait_for_jobs(get_job_scheduler().store, request_ids, wait)
+    return jsonify(
+        {
+            "jobs": {
+                job_id: get_job_status(job) if job else None
+                for job_id, job in jobs.items()
+            }
+        }
+    )
@@ -1,75 +1,505 @@
-from flask import Blueprint, jsonify, current_app, request, Response
+from flask import Blueprint, jsonify, request, Response
 import subprocess
+import math
 import os
 import re
 import json
-import sys
 import traceback
-from azure.storage.blob import BlobServiceClient
 import shutil
-from typing import Union
+from typing import List, Tuple, Union
 import uuid
+import tempfile
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from api.utils.blob_storage import upload_executor
+from api.utils.code_validation import CodeValidationError, validate_scene_code
+from api.utils.render_pool import USE_RENDER_POOL, get_render_pool
+from api.utils.render_profiles import (
+    estimate_render_cost,
+    get_animation_calls,
+    get_api_key,
+    get_profile_frame_size,
+    get_render_profile,
+    needs_reencoding,
+    reencode_video,
+)
+from api.utils.process_output import OutputReader, get_process_output_sources
+from api.utils.storage import get_storage
+from api.utils.render_cache import (
+    USE_RENDER_CACHE,
+    get_render_cache,
+    get_render_cache_key,
+)
 
 video_rendering_bp = Blueprint("video_rendering", __name__)
 
 
-USE_LOCAL_STORAGE = os.getenv("USE_LOCAL_STORAGE", "true") == "true"
 BASE_URL = os.getenv("BASE_URL", "http://127.0.0.1:8080")
+EXPORT_DOWNLOAD_WORKERS = int(os.getenv("EXPORT_DOWNLOAD_WORKERS", "4"))
+# Render profile of the drafts of progressive renders
+RENDER_DRAFT_PROFILE = os.getenv("RENDER_DRAFT_PROFILE", "preview")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
+# A session to reuse HTTP connections between scene downloads
+download_session = requests.Session()
+download_session.mount(
+    "https://", HTTPAdapter(pool_maxsize=EXPORT_DOWNLOAD_WORKERS)
+)
+download_session.mount(
+    "http://", HTTPAdapter(pool_maxsize=EXPORT_DOWNLOAD_WORKERS)
+)
 
-def upload_to_azure_storage(file_path: str, video_storage_file_name: str) -> str:
+
+def get_frame_config(aspect_ratio):
+    if aspect_ratio == "16:9":
+        return (3840, 2160), 14.22
+    elif aspect_ratio == "9:16":
+        return (1080, 1920), 8.0
+    elif aspect_ratio == "1:1":
+        return (1080, 1080), 8.0
+    else:
+        return (3840, 2160), 14.22
+
+
+def start_render_process(command_list: List[str], cwd: str):
     """
-    Uploads the video to Azure Blob Storage and returns the URL.
+    Starts `manim` with the given command, on a warm worker if the render
+    pool is enabled. Returns the process and the sources of its output.
     """
-    cloud_file_name = f"{video_storage_file_name}.mp4"
-
-    connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    blob_client = blob_service_client.get_blob_client(
-        container=container_name, blob=cloud_file_name
+    if USE_RENDER_POOL:
+        # Render on a warm worker, which already has Manim imported
+        job = get_render_pool().submit(command_list[1:], cwd)
+        return job, [job]
+    process = subprocess.Popen(
+        command_list,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        text=True,
+        bufsize=1,  # Ensure the output is in text mode and line-buffered
     )
+    return process, get_process_output_sources(process)
 
-    # Upload the video file
-    with open(file_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
 
-    # Construct the URL of the uploaded blob
-    blob_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{cloud_file_name}"
-    return blob_url
+def stop_render_processes(processes: list):
+    """
+    Stops the renders started by `start_render_process` that are still
+    running, and waits for them to exit.
+    """
+    for process in processes:
+        if isinstance(process, subprocess.Popen):
+            if process.poll() is None:
+                process.terminate()
+        else:
+            process.cancel()
+    for process in processes:
+        if isinstance(process, subprocess.Popen):
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
 
 
-def move_to_public_folder(
-    file_path: str, video_storage_file_name: str, base_url: Union[str, None] = None
-) -> str:
+def count_animations(code: str) -> int:
     """
-    Moves the video to the public folder and returns the URL.
+    Counts the `self.play()` and `self.wait()` calls in the code. Calls made
+    in loops are only counted once, so this is a lower bound in most scenes.
     """
-    public_folder = os.path.join(os.path.dirname(__file__), "public")
-    os.makedirs(public_folder, exist_ok=True)
+    return len(get_animation_calls(code))
 
-    new_file_name = f"{video_storage_file_name}.mp4"
-    new_file_path = os.path.join(public_folder, new_file_name)
 
-    shutil.move(file_path, new_file_path)
+def get_shard_ranges(code: str, shards: int) -> List[Tuple[int, Union[int, None]]]:
+    """
+    Splits the animations of a scene into at most `shards` ranges of
+    animation numbers, as passed to Manim's `-n` option. The last range is
+    left open, so animations the static count missed are still rendered.
+    """
+    animation_count = count_animations(code)
+    shards = min(shards, animation_count)
+    if shards < 2:
+        return []
+    size = math.ceil(animation_count / shards)
+    ranges = [(i * size, (i + 1) * size - 1) for i in range(shards - 1)]
+    ranges.append(((shards - 1) * size, None))
+    return ranges
 
-    # Use the provided base_url if available, otherwise fall back to BASE_URL
-    url_base = base_url if base_url else BASE_URL
-    video_url = f"{url_base.rstrip('/')}/public/{new_file_name}"
-    return video_url
 
+def concat_videos(video_paths: List[str], output_path: str):
+    """
+    Joins videos with the same codec, resolution and frame rate by copying
+    their streams, without re-encoding.
+    """
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w") as f:
+        for path in video_paths:
+            escaped_path = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped_path}'\n")
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_path,
+                "-c",
+                "copy",
+                output_path,
+            ],
+            check=True,
+        )
+    finally:
+        os.remove(list_path)
 
-def get_frame_config(aspect_ratio):
-    if aspect_ratio == "16:9":
-        return (3840, 2160), 14.22
-    elif aspect_ratio == "9:16":
-        return (1080, 1920), 8.0
-    elif aspect_ratio == "1:1":
-        return (1080, 1080), 8.0
-    else:
-        return (3840, 2160), 14.22
+
+def probe_video(video_path: str) -> Union[dict, None]:
+    """
+    Returns the codec parameters of the streams of a video, or None if it
+    can't be read.
+    """
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,sample_rate,channels",
+                "-of",
+                "json",
+                video_path,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        return json.loads(result.stdout)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def videos_are_concat_compatible(video_paths: List[str]) -> bool:
+    """
+    Whether the videos have the same streams, with the same codec,
+    resolution and frame rate, so they can be joined without re-encoding.
+    """
+    probes = [probe_video(path) for path in video_paths]
+    if not probes or any(probe is None for probe in probes):
+        return False
+    return all(probe == probes[0] for probe in probes[1:])
+
+
+def render_scene(
+    code: str,
+    file_class: Union[str, None],
+    aspect_ratio: Union[str, None],
+    video_storage_file_name: str,
+    base_url: Union[str, None] = None,
+    shards: int = 1,
+    draft: bool = False,
+    profile: Union[dict, None] = None,
+    wait_for_upload: bool = True,
+):
+    """
+    Renders a Manim scene and stores the resulting video.
+
+    `profile` sets the resolution, frame rate and encoding of the video (see
+    `render_profiles.py`), the default profile if None.
+
+    With `shards` > 1, ranges of animations are rendered in parallel
+    processes and the resulting videos are joined without re-encoding.
+
+    With `draft`, the scene is rendered with the size and frame rate of the
+    `RENDER_DRAFT_PROFILE` profile instead, and isn't re-encoded, to show a
+    result quickly before the final render.
+
+    Yields progress events as dicts, in the same shape they are streamed to
+    the client: `{"animationIndex": int, "percentage": int}` while rendering,
+    then either `{"video_url": str}` or `{"error": str}`.
+
+    Without `wait_for_upload`, a video stored in Azure is uploaded in the
+    background, and the last event is `{"video_upload": Future}` instead,
+    whose result is the video URL. This is for the job workers only, as the
+    event can't be sent to a client.
+    """
+    # Determine frame size and width based on aspect ratio
+    frame_size, frame_width = get_frame_config(aspect_ratio)
+    if draft:
+        # A draft is replaced by the final video soon, so it keeps the
+        # encoding of Manim instead of paying for another encode
+        profile = {**get_render_profile(RENDER_DRAFT_PROFILE), "codec": "libx264", "crf": None}
+        video_storage_file_name = f"{video_storage_file_name}-draft"
+    profile = profile or get_render_profile()
+    frame_size = get_profile_frame_size(profile, frame_size)
+
+    storage = get_storage()
+    cache_key = None
+    if USE_RENDER_CACHE:
+        cache_key = get_render_cache_key(code, file_class, frame_size, frame_width, profile)
+        cached = get_render_cache().get(cache_key, storage)
+        if cached:
+            video_url = storage.get_url(cached["file_name"], base_url)
+            print(f"Render cache hit: {video_url}")
+            yield {"video_url": video_url}
+            return
+        # Name the video after its content, so identical renders share it
+        video_storage_file_name = f"video-{cache_key}"
+
+    # Modify the Manim script to include configuration settings
+    modified_code = f"""
+from manim import *
+from math import *
+config.frame_size = {frame_size}
+config.frame_width = {frame_width}
+
+{code}
+    """
+
+    # Create a unique file name
+    file_name = f"scene_{os.urandom(2).hex()}.py"
+
+    # Adjust the path to point to /api/public/
+    api_dir = os.path.dirname(os.path.dirname(__file__))  # Go up one level from routes
+    public_dir = os.path.join(api_dir, "public")
+    os.makedirs(public_dir, exist_ok=True)  # Ensure the public directory exists
+    file_path = os.path.join(public_dir, file_name)
+
+    # Write the code to the file
+    with open(file_path, "w") as f:
+        f.write(modified_code)
+
+    # Render into a folder of its own, so concurrent renders of the same
+    # scene class don't overwrite each other's video
+    routes_dir = os.path.dirname(os.path.realpath(__file__))
+    media_dir = tempfile.mkdtemp(prefix="render_", dir=routes_dir)
+    video_file_path = os.path.join(media_dir, f"{file_class or 'GenScene'}.mp4")
+    processes = []
+
+    try:
+        command_list = [
+            "manim",
+            file_path,  # Use the full path to the file
+            file_class or "GenScene",
+            "--format=mp4",
+            "--custom_folders",
+            "--frame_rate",
+            str(profile["frame_rate"]),
+        ]
+
+        # Each shard renders a range of animations into its own folder. Scenes
+        # with sound are rendered at once, as the audio isn't split the same way.
+        shard_ranges = get_shard_ranges(code, shards) if shards > 1 else []
+        if shard_ranges and not ("add_sound" in code or "voiceover" in code):
+            shard_dirs = []
+            sources = []
+            for start, end in shard_ranges:
+                shard_dir = os.path.join(media_dir, f"shard_{start}")
+                os.makedirs(shard_dir)
+                shard_command = command_list + [
+                    "--media_dir",
+                    shard_dir,
+                    "-n",
+                    f"{start},{end}" if end is not None else str(start),
+                ]
+                process, process_sources = start_render_process(shard_command, routes_dir)
+                shard_dirs.append(shard_dir)
+                processes.append(process)
+                sources.extend(process_sources)
+        else:
+            shard_dirs = [media_dir]
+            process, sources = start_render_process(
+                command_list + ["--media_dir", media_dir], routes_dir
+            )
+            processes.append(process)
+        output_reader = OutputReader(sources)
+
+        current_animation = -1
+        current_percentage = 0
+        sent_percentage = 0
+        error_output = []
+        in_error = False
+
+        for stream_name, line in output_reader:
+            if stream_name == "stdout":
+                print("STDOUT:", line.strip())
+                continue
+
+            error = line
+            print("STDERR:", error.strip())
+            error_output.append(error.strip())
+
+            # Check for critical errors
+            if "is not in the script" in error:
+                in_error = True
+                continue
+
+            # Check for start of error
+            if "Traceback (most recent call last)" in error:
+                in_error = True
+                continue
+
+            # If we're in an error state, keep accumulating the error message
+            if in_error:
+                if error.strip() == "":
+                    # Empty line might indicate end of traceback
+                    in_error = False
+                    yield {"error": "\n".join(error_output)}
+                    return
+                continue
+
+            animation_match = re.search(r"Animation (\d+):", error)
+            if animation_match:
+                new_animation = int(animation_match.group(1))
+                if new_animation != current_animation:
+                    current_animation = new_animation
+                    current_percentage = 0
+                    sent_percentage = 0
+                    yield {"animationIndex": current_animation, "percentage": 0}
+
+            percentage_match = re.search(r"(\d+)%", error)
+            if percentage_match:
+                current_percentage = int(percentage_match.group(1))
+                # Skip updates that are already outdated by queued lines
+                if current_percentage != sent_percentage and not output_reader.has_pending():
+                    sent_percentage = current_percentage
+                    yield {"animationIndex": current_animation, "percentage": current_percentage}
+
+        if current_percentage != sent_percentage:
+            yield {"animationIndex": current_animation, "percentage": current_percentage}
+
+        for process in processes:
+            if isinstance(process, subprocess.Popen):
+                process.wait()
+
+        if any(process.returncode != 0 for process in processes):
+            yield {"error": "\n".join(error_output)}
+            return
+
+        if len(shard_dirs) > 1:
+            # A shard past the actual last animation doesn't produce a video
+            shard_videos = [
+                os.path.join(shard_dir, os.path.basename(video_file_path))
+                for shard_dir in shard_dirs
+            ]
+            shard_videos = [
+                path for path in shard_videos
+                if os.path.exists(path) and os.path.getsize(path) > 0
+            ]
+            concat_videos(shard_videos, video_file_path)
+
+        if os.path.exists(video_file_path):
+            print(f"Video file found at: {video_file_path}")
+        else:
+            print(f"Video file not found. Files in render directory: {os.listdir(media_dir)}")
+            raise FileNotFoundError(f"Video file not found at {video_file_path}")
+
+        if needs_reencoding(profile):
+            reencode_video(video_file_path, profile)
+
+        video_file_name = f"{video_storage_file_name}.mp4"
+        if not storage.is_remote:
+            video_url = storage.save(video_file_path, video_file_name, base_url)
+            if cache_key:
+                get_render_cache().put(cache_key, storage, video_file_name)
+        else:
+            # Move the video out of the render directory, which is removed
+            # before a background upload is over
+            upload_path = f"{media_dir}.mp4"
+            shutil.move(video_file_path, upload_path)
+
+            def upload():
+                try:
+                    video_url = storage.save(upload_path, video_file_name, base_url)
+                finally:
+                    if os.path.exists(upload_path):
+                        os.remove(upload_path)
+                if cache_key:
+                    get_render_cache().put(cache_key, storage, video_file_name)
+                return video_url
+
+            if not wait_for_upload:
+                yield {"video_upload": upload_executor.submit(upload)}
+                return
+            video_url = upload()
+        print(f"Video URL: {video_url}")
+        yield {"video_url": video_url}
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        traceback.print_exc()
+        yield {"error": f"Unexpected error occurred: {str(e)}"}
+    finally:
+        # A render that ended early may still have shards running, which
+        # must not write into the render directory while it's removed
+        stop_render_processes(processes)
+        # Remove the temporary Python file and the render directory
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print(f"Removed temporary file: {file_path}")
+            shutil.rmtree(media_dir, ignore_errors=True)
+        except Exception as e:
+            print(f"Error removing temporary file {file_path}: {e}")
+
+
+def render_progressive(
+    code: str,
+    file_class: Union[str, None],
+    aspect_ratio: Union[str, None],
+    video_storage_file_name: str,
+    base_url: Union[str, None],
+    shards: int,
+    user_id: str,
+    profile: dict,
+):
+    """
+    Renders a draft of the scene, then queues the final render (with
+    `profile`) as a video generation job.
+
+    Yields the progress events of the draft, then
+    `{"draft_url": str, "request_id": str, "status": str}`, where
+    `request_id` is the job to follow with
+    `/v1/video/generation/status/<request_id>`. The job keeps the draft URL
+    along with the final video URL.
+    """
+    # Imported here, as the video generation routes import this module
+    from api.routes.video_generation import get_job_scheduler, get_public_status
+    from api.utils.job_queue import QueueFullError
+
+    draft_url = None
+    for event in render_scene(
+        code, file_class, aspect_ratio, video_storage_file_name, base_url, shards, draft=True
+    ):
+        if "video_url" in event:
+            draft_url = event["video_url"]
+            continue
+        yield event
+        if "error" in event:
+            return
+
+    job_request = {
+        "code": code,
+        "file_class": file_class,
+        "aspect_ratio": aspect_ratio,
+        "base_url": base_url,
+        "profile": profile["name"],
+        "draft_url": draft_url,
+    }
+    try:
+        job = get_job_scheduler().submit(user_id, job_request)
+    except QueueFullError as e:
+        yield {"draft_url": draft_url, "error": str(e)}
+        return
+    yield {"draft_url": draft_url, "request_id": job["id"], "status": get_public_status(job)}
 
 
 @video_rendering_bp.route("/v1/video/rendering", methods=["POST"])
@@ -91,7 +521,6 @@ def render_video():
     
     # Extract the rest of the request data
     code = request.json.get("code")
-    file_name = request.json.get("file_name")
     file_class = request.json.get("file_class")
 
     user_id = request.json.get("user_id") or str(uuid.uuid4())
@@ -104,254 +533,125 @@ def render_video():
     # Stream the percentage of animation it shown in the error
     stream = request.json.get("stream", False)
 
+    # Render a low quality draft first, and the final video in the background
+    progressive = request.json.get("progressive", False)
+
+    # Render ranges of animations in parallel, up to the number of CPU cores
+    try:
+        shards = min(int(request.json.get("shards", 1)), os.cpu_count() or 1)
+    except (TypeError, ValueError):
+        return jsonify(error="Shards must be an integer"), 400
+
+    # Resolution, frame rate and encoding, by name or from the API key
+    try:
+        profile = get_render_profile(request.json.get("profile"), get_api_key(request.headers))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
     video_storage_file_name = f"video-{user_id}-{project_name}-{iteration}"
 
     if not code:
         return jsonify(error="No code provided"), 400
 
-    # Determine frame size and width based on aspect ratio
-    frame_size, frame_width = get_frame_config(aspect_ratio)
-
-    # Modify the Manim script to include configuration settings
-    modified_code = f"""
-from manim import *
-from math import *
-config.frame_size = {frame_size}
-config.frame_width = {frame_width}
+    # Reject code that can't render before starting Manim
+    try:
+        code = validate_scene_code(code, file_class)
+    except CodeValidationError as e:
+        return jsonify(error=str(e)), 400
+
+    if progressive:
+        events = render_progressive(
+            code,
+            file_class,
+            aspect_ratio,
+            video_storage_file_name,
+            request.host_url,
+            shards,
+            user_id,
+            profile,
+        )
+    else:
+        events = render_scene(
+            code,
+            file_class,
+            aspect_ratio,
+            video_storage_file_name,
+            request.host_url,
+            shards,
+            profile=profile,
+        )
 
-{code}
-    """
+    if stream:
+        # TODO: If the `render_video()` fails, or it's sending {"error"}, be sure to add `500`
+        return Response(
+            (f"{json.dumps(event)}\n" for event in events),
+            content_type="text/event-stream",
+            status=207,
+        )
 
-    # Create a unique file name
-    file_name = f"scene_{os.urandom(2).hex()}.py"
-    
-    # Adjust the path to point to /api/public/
-    api_dir = os.path.dirname(os.path.dirname(__file__))  # Go up one level from routes
-    public_dir = os.path.join(api_dir, "public")
-    os.makedirs(public_dir, exist_ok=True)  # Ensure the public directory exists
-    file_path = os.path.join(public_dir, file_name)
+    video_url = None
+    draft = None
+    for event in events:
+        if "error" in event:
+            print(f"Error in non-streaming mode: {event['error']}")
+            return jsonify({"error": event["error"]}), 500
+        if "video_url" in event:
+            video_url = event["video_url"]
+        elif "draft_url" in event:
+            draft = event
+
+    if draft:
+        return (
+            jsonify(
+                {
+                    "message": "Draft video generated, the final video is rendering",
+                    **draft,
+                }
+            ),
+            202,
+        )
 
-    # Write the code to the file
-    with open(file_path, "w") as f:
-        f.write(modified_code)
+    if video_url:
+        return (
+            jsonify(
+                {
+                    "message": "Video generation completed",
+                    "video_url": video_url,
+                }
+            ),
+            200,
+        )
+    return (
+        jsonify({"message": "Video generation completed, but no URL was found"}),
+        200,
+    )
 
-    def render_video():
-        try:
-            command_list = [
-                "manim",
-                file_path,  # Use the full path to the file
-                file_class,
-                "--format=mp4",
-                "--media_dir",
-                ".",
-                "--custom_folders",
-            ]
 
-            process = subprocess.Popen(
-                command_list,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=os.path.dirname(os.path.realpath(__file__)),
-                text=True,
-                bufsize=1,  # Ensure the output is in text mode and line-buffered
-            )
-            current_animation = -1
-            current_percentage = 0
-            error_output = []
-            in_error = False
-
-            while True:
-                output = process.stdout.readline()
-                error = process.stderr.readline()
-
-                if output == "" and error == "" and process.poll() is not None:
-                    break
-
-                if output:
-                    print("STDOUT:", output.strip())
-                if error:
-                    print("STDERR:", error.strip())
-                    error_output.append(error.strip())
-                    
-                # Check for critical errors
-                if "is not in the script" in error:
-                    in_error = True
-                    continue
-
-                # Check for start of error
-                if "Traceback (most recent call last)" in error:
-                    in_error = True
-                    continue
-
-                # If we're in an error state, keep accumulating the error message
-                if in_error:
-                    if error.strip() == "":
-                        # Empty line might indicate end of traceback
-                        in_error = False
-                        full_error = "\n".join(error_output)
-                        yield f'{{"error": {json.dumps(full_error)}}}\n'
-                        return
-                    continue
-
-                animation_match = re.search(r"Animation (\d+):", error)
-                if animation_match:
-                    new_animation = int(animation_match.group(1))
-                    if new_animation != current_animation:
-                        current_animation = new_animation
-                        current_percentage = 0
-                        yield f'{{"animationIndex": {current_animation}, "percentage": 0}}\n'
-
-                percentage_match = re.search(r"(\d+)%", error)
-                if percentage_match:
-                    new_percentage = int(percentage_match.group(1))
-                    if new_percentage != current_percentage:
-                        current_percentage = new_percentage
-                        yield f'{{"animationIndex": {current_animation}, "percentage": {current_percentage}}}\n'
-
-            if process.returncode == 0:
-                # Update this part
-                video_file_path = os.path.join(
-                    os.path.dirname(os.path.realpath(__file__)),
-                    f"{file_class or 'GenScene'}.mp4"
-                )
-                # Looking for video file at: {video_file_path}
-                
-                if not os.path.exists(video_file_path):
-                    #  Video file not found. Searching in parent directory...
-                    video_file_path = os.path.join(
-                        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
-                        f"{file_class or 'GenScene'}.mp4"
-                    )
-                    # New video file path is: {video_file_path}
-
-                if os.path.exists(video_file_path):
-                    print(f"Video file found at: {video_file_path}")
-                else:
-                    print(f"Video file not found. Files in current directory: {os.listdir(os.path.dirname(video_file_path))}")
-                    raise FileNotFoundError(f"Video file not found at {video_file_path}")
-
-                print(f"Files in video file directory: {os.listdir(os.path.dirname(video_file_path))}")
-                
-                if USE_LOCAL_STORAGE:
-                    # Pass request.host_url if available
-                    base_url = (
-                        request.host_url
-                        if request and hasattr(request, "host_url")
-                        else None
-                    )
-                    video_url = move_to_public_folder(
-                        video_file_path, video_storage_file_name, base_url
-                    )
-                else:
-                    video_url = upload_to_azure_storage(
-                        video_file_path, video_storage_file_name
-                    )
-                print(f"Video URL: {video_url}")
-                if stream:
-                    yield f'{{ "video_url": "{video_url}" }}\n'
-                    sys.stdout.flush()
-                else:
-                    yield {
-                        "message": "Video generation completed",
-                        "video_url": video_url,
-                    }
-            else:
-                full_error = "\n".join(error_output)
-                yield f'{{"error": {json.dumps(full_error)}}}\n'
+@video_rendering_bp.route("/v1/video/rendering/estimate", methods=["POST"])
+def estimate_render():
+    """
+    Estimates the cost of rendering the code with a profile, without
+    rendering it.
+    """
+    code = request.json.get("code")
+    if not code:
+        return jsonify(error="No code provided"), 400
 
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            traceback.print_exc()
-            print(f"Files in current directory after error: {os.listdir('.')}")
-            yield f'{{"error": "Unexpected error occurred: {str(e)}"}}\n'
-        finally:
-            # Remove the temporary Python file
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"Removed temporary file: {file_path}")
-                # Remove the video file
-                if os.path.exists(video_file_path):
-                    os.remove(video_file_path)
-                    print(f"Removed temporary video file: {video_file_path}")
-            except Exception as e:
-                print(f"Error removing temporary file {file_path}: {e}")
+    try:
+        profile = get_render_profile(request.json.get("profile"), get_api_key(request.headers))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-    if stream:
-        # TODO: If the `render_video()` fails, or it's sending {"error"}, be sure to add `500`
-        return Response(
-            render_video(), content_type="text/event-stream", status=207
-        )
-    else:
-        video_url = None
-        try:
-            for result in render_video():  # Iterate through the generator
-                print(f"Generated result: {result}")  # Debug print
-                if isinstance(result, dict):
-                    if "video_url" in result:
-                        video_url = result["video_url"]
-                    elif "error" in result:
-                        raise Exception(result["error"])
-
-            if video_url:
-                return (
-                    jsonify(
-                        {
-                            "message": "Video generation completed",
-                            "video_url": video_url,
-                        }
-                    ),
-                    200,
-                )
-            else:
-                return (
-                    jsonify(
-                        {
-                            "message": "Video generation completed, but no URL was found"
-                        }
-                    ),
-                    200,
-                )
-        except StopIteration:
-            if video_url:
-                return (
-                    jsonify(
-                        {
-                            "message": "Video generation completed",
-                            "video_url": video_url,
-                        }
-                    ),
-                    200,
-                )
-            else:
-                return (
-                    jsonify(
-                        {
-                            "message": "Video generation completed, but no URL was found"
-                        }
-                    ),
-                    200,
-                )
-        except Exception as e:
-            print(f"Error in non-streaming mode: {e}")
-            return jsonify({"error": str(e)}), 500
+    frame_size, _ = get_frame_config(request.json.get("aspect_ratio"))
+    return jsonify(estimate_render_cost(code, profile, frame_size))
 
 
 @video_rendering_bp.route("/v1/video/exporting", methods=["POST"])
 def export_video():
     scenes = request.json.get("scenes")
     title_slug = request.json.get("titleSlug")
-    local_filenames = []
-
-    # Download each scene
-    for scene in scenes:
-        video_url = scene["videoUrl"]
-        object_name = video_url.split("/")[-1]
-        local_filename = download_video(video_url)
-        local_filenames.append(local_filename)
-
-    # Create a list of input file arguments for ffmpeg
-    input_files = " ".join([f"-i {filename}" for filename in local_filenames])
+    host_url = request.host_url
+    download_dir = tempfile.mkdtemp(prefix="export_")
 
     # Generate a unique filename with UNIX timestamp
     timestamp = int(time.time())
@@ -359,16 +659,43 @@ def export_video():
         os.getcwd(), f"exported-scene-{title_slug}-{timestamp}.mp4"
     )
 
-    # Command to merge videos using ffmpeg
-    command = f"ffmpeg {input_files} -filter_complex 'concat=n={len(local_filenames)}:v=1:a=0[out]' -map '[out]' {merged_filename}"
-
     try:
-        # Execute the ffmpeg command
-        subprocess.run(command, shell=True, check=True)
+        # Download the scenes concurrently, keeping their order
+        video_urls = [scene["videoUrl"] for scene in scenes]
+        with ThreadPoolExecutor(max_workers=EXPORT_DOWNLOAD_WORKERS) as executor:
+            local_filenames = list(
+                executor.map(
+                    lambda item: download_video(
+                        item[1], download_dir, f"{item[0]}-", host_url
+                    ),
+                    enumerate(video_urls),
+                )
+            )
+
+        if videos_are_concat_compatible(local_filenames):
+            # Scenes rendered with the same frame config can be joined as-is
+            concat_videos(local_filenames, merged_filename)
+        else:
+            # Otherwise re-encode them into a common stream
+            input_files = []
+            for filename in local_filenames:
+                input_files += ["-i", filename]
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    *input_files,
+                    "-filter_complex",
+                    f"concat=n={len(local_filenames)}:v=1:a=0[out]",
+                    "-map",
+                    "[out]",
+                    merged_filename,
+                ],
+                check=True,
+            )
         print("Videos merged successfully.")
         print(f"merged_filename: {merged_filename}")
-        public_url = upload_to_azure_storage(
-            merged_filename, f"exported-scene-{title_slug}-{timestamp}"
+        public_url = get_storage().save(
+            merged_filename, f"exported-scene-{title_slug}-{timestamp}.mp4", host_url
         )
         print(f"Video URL: {public_url}")
         return jsonify(
@@ -380,12 +707,44 @@ def export_video():
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
 
 
-def download_video(video_url):
-    local_filename = video_url.split("/")[-1]
-    response = requests.get(video_url)
-    response.raise_for_status()
-    with open(local_filename, 'wb') as f:
-        f.write(response.content)
+def get_local_public_path(video_url: str, host_url: Union[str, None] = None) -> Union[str, None]:
+    """
+    Returns the local path of a video URL served from our own storage, or
+    None if the URL points somewhere else.
+    """
+    parsed_url = urlparse(video_url)
+    own_hosts = {urlparse(BASE_URL).netloc}
+    if host_url:
+        own_hosts.add(urlparse(host_url).netloc)
+    if parsed_url.netloc not in own_hosts:
+        return None
+    storage = get_storage()
+    name = storage.get_name_from_url_path(parsed_url.path)
+    return storage.get_local_path(name) if name else None
+
+
+def download_video(
+    video_url: str,
+    download_dir: str,
+    prefix: str = "",
+    host_url: Union[str, None] = None,
+) -> str:
+    """
+    Downloads a video to `download_dir` and returns its local path. Videos in
+    our own public folder are used in place.
+    """
+    local_path = get_local_public_path(video_url, host_url)
+    if local_path:
+        return local_path
+
+    local_filename = os.path.join(download_dir, prefix + video_url.split("/")[-1])
+    with download_session.get(video_url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(local_filename, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
     return local_filename
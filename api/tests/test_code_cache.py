@@ -0,0 +1,17 @@
+from api.utils.code_cache import get_code_cache_key, normalize_prompt
+
+
+def test_normalize_prompt_keeps_case():
+    assert normalize_prompt("Write  'HELLO'  in red!!") == "Write 'HELLO' in red"
+
+
+def test_cache_key_differs_by_case_of_text():
+    hello_upper = get_code_cache_key("Write 'HELLO' in red", "gpt-4o", "system")
+    hello_lower = get_code_cache_key("Write 'hello' in red", "gpt-4o", "system")
+    assert hello_upper != hello_lower
+
+
+def test_cache_key_ignores_whitespace_and_trailing_punctuation():
+    assert get_code_cache_key("Draw a  circle.", "gpt-4o", "system") == get_code_cache_key(
+        "Draw a circle", "gpt-4o", "system"
+    )
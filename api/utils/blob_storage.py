@@ -0,0 +1,64 @@
+"""
+Uploads to Azure Blob Storage.
+
+A single `BlobServiceClient` is shared by every upload, so its connections
+are reused. Files larger than `AZURE_UPLOAD_SINGLE_PUT_SIZE_MB` are uploaded
+as blocks of `AZURE_UPLOAD_BLOCK_SIZE_MB`, `AZURE_UPLOAD_MAX_CONCURRENCY` at
+a time.
+
+Uploads can also run on `upload_executor`, so a render worker can start its
+next render while the previous video is uploading.
+
+Any connection string works, including `UseDevelopmentStorage=true` for a
+local Azurite emulator: URLs are taken from the client rather than built for
+`blob.core.windows.net`.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+AZURE_UPLOAD_MAX_CONCURRENCY = int(os.getenv("AZURE_UPLOAD_MAX_CONCURRENCY", "4"))
+AZURE_UPLOAD_BLOCK_SIZE_MB = int(os.getenv("AZURE_UPLOAD_BLOCK_SIZE_MB", "4"))
+AZURE_UPLOAD_SINGLE_PUT_SIZE_MB = int(os.getenv("AZURE_UPLOAD_SINGLE_PUT_SIZE_MB", "8"))
+AZURE_UPLOAD_WORKERS = int(os.getenv("AZURE_UPLOAD_WORKERS", "2"))
+
+_blob_service_client = None
+_blob_service_client_lock = threading.Lock()
+
+upload_executor = ThreadPoolExecutor(max_workers=AZURE_UPLOAD_WORKERS)
+
+
+def get_blob_service_client() -> BlobServiceClient:
+    """
+    Returns the process-wide Blob Storage client.
+    """
+    global _blob_service_client
+    with _blob_service_client_lock:
+        if _blob_service_client is None:
+            _blob_service_client = BlobServiceClient.from_connection_string(
+                os.getenv("AZURE_STORAGE_CONNECTION_STRING"),
+                max_block_size=AZURE_UPLOAD_BLOCK_SIZE_MB * 1024 * 1024,
+                max_single_put_size=AZURE_UPLOAD_SINGLE_PUT_SIZE_MB * 1024 * 1024,
+            )
+        return _blob_service_client
+
+
+def upload_file(file_path: str, blob_name: str, content_type: str = "video/mp4") -> str:
+    """
+    Uploads a file to the storage container, and returns its URL.
+    """
+    blob_client = get_blob_service_client().get_blob_client(
+        container=os.getenv("AZURE_STORAGE_CONTAINER_NAME"), blob=blob_name
+    )
+    with open(file_path, "rb") as data:
+        blob_client.upload_blob(
+            data,
+            overwrite=True,
+            length=os.path.getsize(file_path),
+            max_concurrency=AZURE_UPLOAD_MAX_CONCURRENCY,
+            content_settings=ContentSettings(content_type=content_type),
+        )
+    return blob_client.url
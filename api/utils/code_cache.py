@@ -0,0 +1,127 @@
+"""
+Cache of the code generated by `/v1/code/generation`.
+
+Code generation runs with a fixed system prompt and a low temperature, and
+users repeat the same short prompts ("draw a circle", "plot sin x") a lot.
+Answers are keyed by a hash of the normalized prompt, the model and the
+system prompt, so changing the system prompt invalidates them. Entries expire
+after `CODE_CACHE_TTL` seconds, and at most `CODE_CACHE_MAX_ENTRIES` are kept
+in least-recently-used order.
+
+The cache lives in memory, and is also persisted as JSON when
+`CODE_CACHE_PATH` is set.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Union
+
+USE_CODE_CACHE = os.getenv("USE_CODE_CACHE", "true") == "true"
+CODE_CACHE_TTL = int(os.getenv("CODE_CACHE_TTL", "86400"))
+CODE_CACHE_MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "1000"))
+CODE_CACHE_PATH = os.getenv("CODE_CACHE_PATH", "")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes the differences between prompts that don't change what is
+    asked: Unicode forms, whitespace and trailing punctuation. The case is
+    kept, as it may be the case of text to show in the animation.
+    """
+    prompt = unicodedata.normalize("NFKC", prompt)
+    prompt = re.sub(r"\s+", " ", prompt).strip()
+    return prompt.rstrip(".!?;, ")
+
+
+def get_code_cache_key(prompt: str, model: str, system_prompt: str) -> str:
+    payload = json.dumps(
+        {
+            "prompt": normalize_prompt(prompt),
+            "model": model,
+            "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CodeCache:
+    """
+    LRU cache of generated code with a TTL.
+
+    Entries look like: `{"code": str, "created_at": float}`
+    """
+
+    def __init__(
+        self,
+        path: str = CODE_CACHE_PATH,
+        ttl: int = CODE_CACHE_TTL,
+        max_entries: int = CODE_CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.load()
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("created_at", 0)):
+            if not self.is_expired(entry):
+                self.entries[key] = entry
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+    def is_expired(self, entry: dict) -> bool:
+        return time.time() - entry["created_at"] > self.ttl
+
+    def get(self, key: str) -> Union[str, None]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self.is_expired(entry):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry["code"]
+
+    def put(self, key: str, code: str):
+        with self.lock:
+            self.entries[key] = {"code": code, "created_at": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.save()
+
+
+_code_cache = None
+_code_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CodeCache:
+    global _code_cache
+    with _code_cache_lock:
+        if _code_cache is None:
+            _code_cache = CodeCache()
+        return _code_cache
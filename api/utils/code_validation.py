@@ -0,0 +1,114 @@
+"""
+Static checks of scene code, run before a Manim process is started.
+
+Code that can't render (a syntax error, a missing scene class) would
+otherwise only fail after Manim has started and imported everything, which
+costs seconds for a traceback. The code is parsed once to:
+
+- report syntax errors with their line,
+- check that the scene class exists and derives from a Manim scene,
+- rewrite names of older Manim versions, that models often generate, to
+  their Manim Community equivalent (like `ShowCreation` to `Create`).
+"""
+
+import ast
+from typing import Dict, List, Tuple, Union
+
+# Names removed from Manim, and their replacement
+API_MIGRATIONS = {
+    "ShowCreation": "Create",
+    "TextMobject": "Tex",
+    "TexMobject": "MathTex",
+}
+
+
+class CodeValidationError(Exception):
+    pass
+
+
+def get_base_name(base: ast.expr) -> Union[str, None]:
+    """
+    Returns the name of a base class, either `Scene` or `manim.Scene`.
+    """
+    if isinstance(base, ast.Name):
+        return base.id
+    if isinstance(base, ast.Attribute):
+        return base.attr
+    return None
+
+
+def is_scene_class(class_name: str, classes: Dict[str, ast.ClassDef], seen=None) -> bool:
+    """
+    Whether a class derives from a Manim scene, directly or through other
+    classes of the same code. Every Manim scene class name ends with "Scene".
+    """
+    seen = seen or set()
+    seen.add(class_name)
+    for base in classes[class_name].bases:
+        base_name = get_base_name(base)
+        if base_name is None:
+            continue
+        if base_name in classes and base_name not in seen:
+            if is_scene_class(base_name, classes, seen):
+                return True
+        elif base_name.endswith("Scene"):
+            return True
+    return False
+
+
+def apply_api_migrations(code: str, tree: ast.Module) -> Tuple[str, List[str]]:
+    """
+    Renames the uses of removed Manim names, keeping the rest of the code as
+    it is. Names the code defines itself are left alone.
+    """
+    defined = {
+        node.name
+        for node in ast.walk(tree)
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+    }
+    replacements = [
+        (node.lineno, node.col_offset, node.end_col_offset, API_MIGRATIONS[node.id])
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and node.id in API_MIGRATIONS and node.id not in defined
+    ]
+    if not replacements:
+        return code, []
+
+    lines = code.splitlines(keepends=True)
+    fixes = set()
+    # From the end, so earlier offsets stay valid
+    for lineno, start, end, new_name in sorted(replacements, reverse=True):
+        # AST offsets are in UTF-8 bytes
+        line = lines[lineno - 1].encode("utf-8")
+        fixes.add(f"{line[start:end].decode('utf-8')} -> {new_name}")
+        lines[lineno - 1] = (line[:start] + new_name.encode("utf-8") + line[end:]).decode("utf-8")
+    return "".join(lines), sorted(fixes)
+
+
+def validate_scene_code(code: str, class_name: Union[str, None] = None) -> str:
+    """
+    Checks that `code` can be rendered as the scene `class_name` (GenScene
+    by default), and returns it with the known API migrations applied.
+
+    Raises `CodeValidationError` with a message meant for the user (or the
+    model) otherwise.
+    """
+    class_name = class_name or "GenScene"
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise CodeValidationError(f"Syntax error on line {e.lineno}: {e.msg}")
+
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    if class_name not in classes:
+        found = ", ".join(classes) or "none"
+        raise CodeValidationError(
+            f"Scene class `{class_name}` not found in the code (classes found: {found})"
+        )
+    if not is_scene_class(class_name, classes):
+        raise CodeValidationError(f"Class `{class_name}` must inherit from a Manim Scene")
+
+    code, fixes = apply_api_migrations(code, tree)
+    if fixes:
+        print(f"Applied Manim API migrations: {', '.join(fixes)}")
+    return code
@@ -0,0 +1,179 @@
+"""
+Image budget for the chat tool loop.
+
+Every `get_preview` call adds frames to the conversation, and the whole
+conversation is sent again on each turn. `ImageBudgetedConversation` keeps
+track of the images and an estimate of the tokens of each message as they
+are appended. When new frames would exceed the engine's image budget, or
+its token budget, it compacts the oldest previews in place: first down to
+their middle frame, then entirely, leaving a short text note instead of the
+images. Text is never removed, so frames that don't fit in what the text
+leaves of the token budget aren't added.
+
+Messages are edited in place rather than removed, so the assistant/tool
+message pairs the APIs expect stay intact.
+"""
+
+from collections import deque
+from typing import List
+
+# Maximum number of images kept in the conversation, per engine
+ENGINE_IMAGE_BUDGETS = {
+    "openai": 50,
+    "anthropic": 20,
+    # DeepSeek conversations go through the OpenAI client
+    "deepseek": 50,
+}
+
+# Estimated tokens of the conversation sent back on each turn, per engine,
+# leaving room for the answer in the context window of the model
+ENGINE_TOKEN_BUDGETS = {
+    "openai": 100000,
+    "anthropic": 150000,
+    "deepseek": 48000,
+}
+
+# Rough token cost of a preview frame and of a text character
+IMAGE_TOKEN_ESTIMATE = 85
+CHARS_PER_TOKEN = 4
+
+
+def is_image_part(part) -> bool:
+    return isinstance(part, dict) and part.get("type") in ("image_url", "image")
+
+
+def count_images(content) -> int:
+    """
+    Counts the images of a message content, including the ones nested in
+    Anthropic `tool_result` blocks.
+    """
+    if not isinstance(content, list):
+        return 0
+    total = 0
+    for part in content:
+        if is_image_part(part):
+            total += 1
+        elif isinstance(part, dict) and part.get("type") == "tool_result":
+            total += count_images(part.get("content"))
+    return total
+
+
+def estimate_tokens(content) -> int:
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN
+    if not isinstance(content, list):
+        return 0
+    tokens = 0
+    for part in content:
+        if is_image_part(part):
+            tokens += IMAGE_TOKEN_ESTIMATE
+        elif isinstance(part, dict):
+            tokens += estimate_tokens(part.get("text") or part.get("content"))
+    return tokens
+
+
+def keep_images(content: List, keep: int) -> List:
+    """
+    Returns the content with only its middle `keep` images, and a text note
+    in place of the removed ones.
+    """
+    image_total = count_images(content)
+    first_kept = (image_total - keep) // 2
+    position = 0
+    removed = 0
+
+    def compact(parts):
+        nonlocal position, removed
+        compacted = []
+        for part in parts:
+            if is_image_part(part):
+                if first_kept <= position < first_kept + keep:
+                    compacted.append(part)
+                else:
+                    removed += 1
+                position += 1
+            elif isinstance(part, dict) and part.get("type") == "tool_result" and isinstance(part.get("content"), list):
+                compacted.append({**part, "content": compact(part["content"])})
+            else:
+                compacted.append(part)
+        return compacted
+
+    content = compact(content)
+    if not removed:
+        return content
+    note = {
+        "type": "text",
+        "text": f"[{removed} preview frame(s) of an earlier iteration were removed to save space]",
+    }
+    # Keep the note next to the images it replaces, inside the tool result if any
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "tool_result" and isinstance(part.get("content"), list):
+            part["content"].append(note)
+            return content
+    content.append(note)
+    return content
+
+
+class ImageBudgetedConversation:
+    """
+    Wraps a list of messages, and keeps its images within a budget of
+    images and of estimated tokens.
+
+    The wrapped list is updated in place, so it can still be passed as is to
+    the OpenAI or Anthropic clients.
+    """
+
+    def __init__(self, messages: List[dict], engine: str):
+        self.messages = messages
+        self.max_images = ENGINE_IMAGE_BUDGETS.get(engine, 0)
+        self.max_tokens = ENGINE_TOKEN_BUDGETS.get(engine, 0)
+        # Messages with images, oldest first
+        self.image_messages = deque()
+        self.image_count = 0
+        self.estimated_tokens = 0
+        for message in messages:
+            self.track(message)
+
+    def track(self, message: dict):
+        content = message.get("content")
+        self.estimated_tokens += estimate_tokens(content)
+        image_count = count_images(content)
+        if image_count:
+            self.image_messages.append(message)
+            self.image_count += image_count
+
+    def append(self, message: dict):
+        self.messages.append(message)
+        self.track(message)
+
+    def compact(self, message: dict, keep: int):
+        content = message["content"]
+        before_images = count_images(content)
+        before_tokens = estimate_tokens(content)
+        message["content"] = keep_images(content, keep)
+        self.image_count -= before_images - count_images(message["content"])
+        self.estimated_tokens += estimate_tokens(message["content"]) - before_tokens
+
+    def is_over_budget(self, new_images: int) -> bool:
+        return (
+            self.image_count + new_images > self.max_images
+            or self.estimated_tokens + new_images * IMAGE_TOKEN_ESTIMATE > self.max_tokens
+        )
+
+    def make_room(self, new_images: int) -> int:
+        """
+        Compacts the oldest previews until `new_images` fit in the budgets,
+        and returns how many new images can be added.
+        """
+        new_images = min(new_images, self.max_images)
+        # First keep a single frame of the oldest previews
+        for message in list(self.image_messages):
+            if not self.is_over_budget(new_images):
+                break
+            if count_images(message["content"]) > 1:
+                self.compact(message, 1)
+        # Then drop the remaining frames, oldest first
+        while self.image_messages and self.is_over_budget(new_images):
+            self.compact(self.image_messages.popleft(), 0)
+        token_room = (self.max_tokens - self.estimated_tokens) // IMAGE_TOKEN_ESTIMATE
+        return max(0, min(new_images, self.max_images - self.image_count, token_room))
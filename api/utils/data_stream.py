@@ -0,0 +1,106 @@
+"""
+Encoder for the text parts of the AI SDK data stream protocol
+(`x-vercel-ai-data-stream: v1`), used when a chat is streamed to the platform.
+
+Every `0:<json string>\\n` line is a separate write to the client, so text
+deltas are batched: at most one text part is sent every
+`STREAM_FLUSH_INTERVAL_MS`, with the deltas received in between joined and
+escaped with a single `json.dumps`. When the model is slower than that,
+every delta is still sent as soon as it arrives, and text that is still
+buffered when the model pauses is sent once the interval is over.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Iterable, Iterator, Union
+
+STREAM_FLUSH_INTERVAL_MS = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "20"))
+
+_STREAM_DONE = object()
+
+
+def encode_text_part(text: str) -> str:
+    return f"0:{json.dumps(text)}\n"
+
+
+class DataStreamEncoder:
+    """
+    Buffers text deltas and yields them as text parts.
+
+    `flush()` must be called at the end of the stream, and before anything
+    that may take a while (like a tool call), so no text is held back.
+    Reading the model's stream through `iter_with_flushes()` sends the
+    buffered text when the next chunk is late.
+    """
+
+    def __init__(self, flush_interval_ms: int = STREAM_FLUSH_INTERVAL_MS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.buffer = []
+        self.last_flush_at = 0.0
+
+    def text(self, delta: str) -> Iterator[str]:
+        if not delta:
+            return
+        self.buffer.append(delta)
+        if time.monotonic() - self.last_flush_at >= self.flush_interval:
+            yield from self.flush()
+
+    def flush(self) -> Iterator[str]:
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer = []
+            self.last_flush_at = time.monotonic()
+            yield encode_text_part(text)
+
+    def get_flush_timeout(self) -> Union[float, None]:
+        """
+        Returns how long the buffered text can still wait, or None when
+        nothing is buffered.
+        """
+        if not self.buffer:
+            return None
+        return max(0.0, self.last_flush_at + self.flush_interval - time.monotonic())
+
+    def iter_with_flushes(self, chunks: Iterable[Any]) -> Iterator[Any]:
+        """
+        Yields the chunks of an upstream stream, read on a thread of its own.
+        When text is buffered and the next chunk doesn't arrive before the
+        end of the flush interval, the text part is yielded in between, as a
+        `str`.
+        """
+        items = queue.Queue()
+        stopped = threading.Event()
+
+        def read():
+            try:
+                for chunk in chunks:
+                    items.put(chunk)
+                    if stopped.is_set():
+                        break
+            except Exception as e:
+                items.put(e)
+            finally:
+                # Closes the upstream request if the caller stopped early
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+                items.put(_STREAM_DONE)
+
+        threading.Thread(target=read, daemon=True).start()
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=self.get_flush_timeout())
+                except queue.Empty:
+                    yield from self.flush()
+                    continue
+                if item is _STREAM_DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
@@ -0,0 +1,275 @@
+"""
+Asynchronous job queue for video generation.
+
+Jobs are persisted in a SQLite database, so their status can be retrieved
+from any request thread (and survives restarts), and are run by a bounded
+pool of worker threads. The scheduler is fair between users: it serves
+users in round-robin order, and within a user the job with the highest
+priority first. Across users, a job with a higher priority still goes first.
+"""
+
+import functools
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Union
+
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "2"))
+RENDER_JOB_MAX_PENDING = int(os.getenv("RENDER_JOB_MAX_PENDING", "100"))
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.sqlite3"),
+)
+
+
+# Statuses of jobs that won't change anymore
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """
+    SQLite-backed store of jobs. Each call uses its own connection, so the
+    store can be shared between threads.
+
+    Threads can wait for jobs to change with `wait_for_update`, which is
+    notified by the updates of this process.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        self.updated = threading.Condition()
+        with self.connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create(self, user_id: str, priority: int, job_request: dict) -> dict:
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "priority": priority,
+            "status": "queued",
+            "request": job_request,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, user_id, priority, status, request, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], user_id, priority, "queued", json.dumps(job_request), now, now),
+            )
+        return job
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        for name in ("progress", "result"):
+            if name in fields and fields[name] is not None:
+                fields[name] = json.dumps(fields[name])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+        with self.updated:
+            self.updated.notify_all()
+
+    def wait_for_update(self, timeout: float):
+        """
+        Waits until a job is updated, or `timeout` seconds. Callers should
+        check the jobs again either way: updates made by other processes, or
+        right before the call, don't wake it up.
+        """
+        with self.updated:
+            self.updated.wait(timeout)
+
+    def get(self, job_id: str) -> Union[dict, None]:
+        with self.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.row_to_job(row) if row else None
+
+    def get_many(self, job_ids: list) -> dict:
+        """
+        Returns the jobs of `job_ids` by ID, with None for unknown IDs.
+        """
+        jobs = dict.fromkeys(job_ids)
+        if not job_ids:
+            return jobs
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self.connect() as connection:
+            rows = connection.execute(
+                f"SELECT * FROM jobs WHERE id IN ({placeholders})", tuple(job_ids)
+            ).fetchall()
+        for row in rows:
+            jobs[row["id"]] = self.row_to_job(row)
+        return jobs
+
+    def list_by_status(self, status: str) -> list:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (status,)
+            ).fetchall()
+        return [self.row_to_job(row) for row in rows]
+
+    @staticmethod
+    def row_to_job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for name in ("request", "progress", "result"):
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+
+class JobScheduler:
+    """
+    Runs jobs from the store on a fixed number of worker threads.
+
+    `runner(job, store)` does the actual work; it should update the job
+    progress through the store and return the result dict. It can also
+    return a `Future` of the result dict, for work that finishes in the
+    background (like an upload), so the worker moves on to the next job.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: Callable[[dict, JobStore], dict],
+        workers: int = RENDER_JOB_WORKERS,
+        max_pending: int = RENDER_JOB_MAX_PENDING,
+    ):
+        self.store = store
+        self.runner = runner
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        # user_id -> heap of (-priority, sequence, job_id), in round-robin order
+        self.user_queues = OrderedDict()
+        self.pending = 0
+        self.sequence = itertools.count()
+
+        # Jobs that were running when the server stopped can't be resumed,
+        # but queued ones are picked up again.
+        for job in store.list_by_status("running"):
+            store.update(job["id"], status="failed", error="Interrupted by a server restart")
+        for job in store.list_by_status("queued"):
+            self.enqueue(job)
+
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def enqueue(self, job: dict, reserved: bool = False):
+        """
+        Queues a stored job. With `reserved`, its slot was already counted
+        in `pending` by `submit()`.
+        """
+        with self.condition:
+            user_queue = self.user_queues.setdefault(job["user_id"], [])
+            heapq.heappush(user_queue, (-job["priority"], next(self.sequence), job["id"]))
+            if not reserved:
+                self.pending += 1
+            self.condition.notify()
+
+    def submit(self, user_id: str, job_request: dict, priority: int = 0) -> dict:
+        """
+        Stores a new job and queues it. Raises `QueueFullError` when too
+        many jobs are already waiting.
+        """
+        # The slot is reserved with the check, so concurrent submits can't
+        # all pass it before any of them is queued
+        with self.condition:
+            if self.pending >= self.max_pending:
+                raise QueueFullError("Too many jobs are queued, please try again later")
+            self.pending += 1
+        try:
+            job = self.store.create(user_id, priority, job_request)
+        except BaseException:
+            with self.condition:
+                self.pending -= 1
+            raise
+        self.enqueue(job, reserved=True)
+        return job
+
+    def next_job_id(self) -> str:
+        """
+        Pops the next job to run. Must be called with the condition held.
+        """
+        # The first user in round-robin order wins ties on priority
+        best_user = None
+        for user_id, user_queue in self.user_queues.items():
+            if best_user is None or user_queue[0][0] < self.user_queues[best_user][0][0]:
+                best_user = user_id
+        user_queue = self.user_queues.pop(best_user)
+        _, _, job_id = heapq.heappop(user_queue)
+        if user_queue:
+            # Move the user to the back of the round-robin order
+            self.user_queues[best_user] = user_queue
+        self.pending -= 1
+        return job_id
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.user_queues:
+                    self.condition.wait()
+                job_id = self.next_job_id()
+
+            job = self.store.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+
+            self.store.update(job_id, status="running")
+            try:
+                result = self.runner(job, self.store)
+            except Exception as e:
+                traceback.print_exc()
+                self.store.update(job_id, status="failed", error=str(e))
+                continue
+
+            if isinstance(result, Future):
+                result.add_done_callback(functools.partial(self.finish, job_id))
+            else:
+                self.store.update(job_id, status="completed", result=result)
+
+    def finish(self, job_id: str, result: Future):
+        """
+        Completes a job whose runner returned a `Future`.
+        """
+        try:
+            self.store.update(job_id, status="completed", result=result.result())
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+            self.store.update(job_id, status="failed", error=str(e))
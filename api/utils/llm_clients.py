@@ -0,0 +1,181 @@
+"""
+Long-lived OpenAI and Anthropic clients shared by every request.
+
+Creating a client per request throws away its connection pool, so every
+code generation paid a new TLS handshake to the provider. The registry
+keeps one client per engine, with a bounded keep-alive pool and explicit
+timeouts, and limits how many requests run against each engine at once.
+A request that can't get a slot within `LLM_QUEUE_TIMEOUT` seconds fails
+with `LLMBusyError`, which the routes answer with a 503.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+import anthropic
+import httpx
+import openai
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Maximum number of requests running at the same time, per engine
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+ANTHROPIC_MAX_CONCURRENCY = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "8"))
+# How long a request waits for a free slot of its engine, in seconds
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+
+class LLMBusyError(Exception):
+    """
+    Every request slot of an engine stayed taken for `LLM_QUEUE_TIMEOUT`.
+    """
+
+
+def create_http_client(http_client_class) -> httpx.Client:
+    return http_client_class(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+class LLMStream:
+    """
+    Chunks of a streaming response, holding a request slot of its engine
+    until the response is consumed or closed.
+    """
+
+    def __init__(self, chunks: Iterable, release: Callable[[], None]):
+        self.chunks = chunks
+        self.release = release
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.chunks, "close", None)
+            if close:
+                close()
+        finally:
+            self.release()
+
+    def __del__(self):
+        self.close()
+
+
+class LLMClients:
+    """
+    One client per engine, created on first use so a missing API key only
+    fails the requests that need it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.semaphores = {
+            "openai": threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY),
+            "anthropic": threading.BoundedSemaphore(ANTHROPIC_MAX_CONCURRENCY),
+        }
+
+    def get(self, engine: str):
+        with self.lock:
+            if engine not in self.clients:
+                self.clients[engine] = self.create(engine)
+            return self.clients[engine]
+
+    @staticmethod
+    def create(engine: str):
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        if engine == "anthropic":
+            return anthropic.Anthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                timeout=timeout,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=create_http_client(anthropic.DefaultHttpxClient),
+            )
+        if engine == "openai":
+            return openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=timeout,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=create_http_client(openai.DefaultHttpxClient),
+            )
+        raise ValueError(f"Unknown engine: {engine}")
+
+    @property
+    def openai(self) -> openai.OpenAI:
+        return self.get("openai")
+
+    @property
+    def anthropic(self) -> anthropic.Anthropic:
+        return self.get("anthropic")
+
+    def acquire(self, engine: str):
+        """
+        Waits for one of the engine's request slots. Raises `LLMBusyError`
+        if none is free within `LLM_QUEUE_TIMEOUT`.
+        """
+        if not self.semaphores[engine].acquire(timeout=LLM_QUEUE_TIMEOUT):
+            raise LLMBusyError(f"Too many requests to {engine}, please retry later")
+
+    @contextmanager
+    def limit(self, engine: str):
+        """
+        Waits for one of the engine's request slots, and holds it.
+        """
+        self.acquire(engine)
+        try:
+            yield
+        finally:
+            self.semaphores[engine].release()
+
+    def stream(self, engine: str, create: Callable, **kwargs) -> LLMStream:
+        """
+        Starts a streaming request with `create(**kwargs)` once a slot is
+        free. The slot is only held while the response is open: it's freed
+        as soon as the stream is consumed or closed.
+        """
+        self.acquire(engine)
+        try:
+            chunks = create(**kwargs)
+        except BaseException:
+            self.semaphores[engine].release()
+            raise
+        return LLMStream(chunks, self.semaphores[engine].release)
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients = {}
+
+
+_llm_clients = None
+_llm_clients_lock = threading.Lock()
+
+
+def get_llm_clients() -> LLMClients:
+    """
+    Returns the process-wide LLM clients.
+    """
+    global _llm_clients
+    with _llm_clients_lock:
+        if _llm_clients is None:
+            _llm_clients = LLMClients()
+        return _llm_clients
@@ -0,0 +1,343 @@
+"""
+Preview engine used by the `get_preview` tool of the chat generation.
+
+Renders a Manim scene to PNG frames, keeps a selection of them, and
+returns them base64-encoded so they can be sent back to the model. Every
+call renders in a directory of its own, and at most
+`PREVIEW_MAX_CONCURRENCY` previews render at the same time. Frames are
+encoded in parallel, as PNG, JPEG or WebP.
+
+Manim is asked for the sampled frames directly, at the preview resolution
+and frame rate, instead of rendering every frame at `-ql` (854x480, 15 FPS)
+and then dropping 3 out of 4 frames and downscaling the rest.
+
+Previews of a conversation can share a workspace (see
+`preview_workspace.py`). Manim only caches animations it writes to a movie,
+so those previews are rendered to MP4 with caching enabled, and the frames
+are then extracted from the video with ffmpeg. A scene without animations
+has no movie: Manim saves its last frame instead, which is used as is.
+"""
+
+import base64
+import io
+import json
+import os
+import random
+import re
+import shutil
+import string
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Tuple, Union
+
+from PIL import Image
+
+from api.utils.code_validation import CodeValidationError, validate_scene_code
+from api.utils.preview_workspace import PreviewWorkspace
+from api.utils.storage import get_preview_storage
+
+PREVIEW_MAX_CONCURRENCY = int(os.getenv("PREVIEW_MAX_CONCURRENCY", "2"))
+# A quarter of the `-ql` resolution and frame rate
+PREVIEW_RESOLUTION = os.getenv("PREVIEW_RESOLUTION", "213,120")
+PREVIEW_FRAME_RATE = os.getenv("PREVIEW_FRAME_RATE", "3.75")
+# Format of the frames sent to the model: "png", "jpeg" or "webp"
+PREVIEW_IMAGE_FORMAT = os.getenv("PREVIEW_IMAGE_FORMAT", "png")
+# Size budget of each encoded frame in bytes, 0 for no budget
+PREVIEW_IMAGE_MAX_BYTES = int(os.getenv("PREVIEW_IMAGE_MAX_BYTES", "0"))
+PREVIEW_ENCODE_WORKERS = int(os.getenv("PREVIEW_ENCODE_WORKERS", "4"))
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+preview_semaphore = threading.BoundedSemaphore(PREVIEW_MAX_CONCURRENCY)
+
+# Pillow releases the GIL while resizing and encoding, so threads are enough
+encode_executor = ThreadPoolExecutor(max_workers=PREVIEW_ENCODE_WORKERS)
+
+# A frame selection policy gets the sorted indices of the rendered frames and
+# returns the indices to keep
+FrameSelectionPolicy = Callable[[List[int]], List[int]]
+
+
+def all_frames(indices: List[int]) -> List[int]:
+    """
+    Keeps every rendered frame.
+    """
+    return indices
+
+
+def every_nth_frame(n: int) -> FrameSelectionPolicy:
+    """
+    Keeps the frames whose index is a multiple of `n`.
+    """
+    return lambda indices: [index for index in indices if index % n == 0]
+
+
+def evenly_spaced_frames(count: int) -> FrameSelectionPolicy:
+    """
+    Keeps `count` frames spread evenly over the animation, including the last one.
+    """
+
+    def select(indices):
+        if len(indices) <= count:
+            return indices
+        step = (len(indices) - 1) / (count - 1) if count > 1 else 0
+        return sorted({indices[round(i * step)] for i in range(count)})
+
+    return select
+
+
+DEFAULT_FRAME_SELECTION = all_frames
+
+
+IMAGE_MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Qualities tried in order until a frame fits in its size budget
+LOSSY_QUALITIES = (85, 70, 55, 40)
+
+
+def encode_frame(
+    image_path: str,
+    image_format: str = PREVIEW_IMAGE_FORMAT,
+    max_bytes: int = PREVIEW_IMAGE_MAX_BYTES,
+) -> Tuple[str, str]:
+    """
+    Returns a frame base64-encoded in `image_format`, along with its media
+    type. Frames are already rendered at the preview resolution.
+
+    For JPEG and WebP, the quality is lowered until the frame fits in
+    `max_bytes` (if set), or the lowest quality is reached.
+    """
+    media_type = IMAGE_MEDIA_TYPES[image_format]
+    if image_format == "png":
+        with open(image_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8"), media_type
+
+    with Image.open(image_path) as img:
+        if image_format == "jpeg":
+            img = img.convert("RGB")
+
+        for quality in LOSSY_QUALITIES:
+            buffer = io.BytesIO()
+            img.save(buffer, format=image_format.upper(), quality=quality)
+            if not max_bytes or buffer.tell() <= max_bytes:
+                break
+    return base64.b64encode(buffer.getvalue()).decode("utf-8"), media_type
+
+
+def encode_frames(
+    image_paths: Dict[int, str],
+    image_format: str = PREVIEW_IMAGE_FORMAT,
+    max_bytes: int = PREVIEW_IMAGE_MAX_BYTES,
+) -> List[dict]:
+    """
+    Encodes frames in parallel on the encoder pool, and returns them in
+    frame order.
+    """
+    indices = sorted(image_paths)
+    encoded = encode_executor.map(
+        lambda index: encode_frame(image_paths[index], image_format, max_bytes), indices
+    )
+    return [
+        {
+            "path": image_paths[index],
+            "index": index,
+            "base64": base64_image,
+            "media_type": media_type,
+        }
+        for index, (base64_image, media_type) in zip(indices, encoded)
+    ]
+
+
+def get_preview(
+    code: str,
+    class_name: str,
+    frame_selection: FrameSelectionPolicy = DEFAULT_FRAME_SELECTION,
+    image_format: str = PREVIEW_IMAGE_FORMAT,
+    max_bytes: int = PREVIEW_IMAGE_MAX_BYTES,
+    workspace: Union[PreviewWorkspace, None] = None,
+) -> str:
+    """
+    get_preview is a function that generates PNGs frames from a Manim script animation.
+
+    With a `workspace`, the animations that didn't change since the last
+    preview of the workspace aren't rendered again.
+
+    Returns a JSON string with a `message` and the selected `images`, or an
+    `error` the model can act upon.
+    """
+    print("Generating preview")
+
+    # The scene the code is validated against is the one rendered
+    class_name = class_name or "GenScene"
+    try:
+        code = validate_scene_code(code, class_name)
+    except CodeValidationError as e:
+        return json.dumps({
+            "error": f"ERROR. The code can't be rendered, please fix it and use `get_preview` to run it again: {str(e)}",
+            "images": []
+        })
+
+    temp_root = os.path.join(API_DIR, "temp_manim")
+    os.makedirs(temp_root, exist_ok=True)
+
+    with workspace.lock if workspace else nullcontext(), preview_semaphore:
+        if workspace:
+            workspace.touch()
+        temp_dir = tempfile.mkdtemp(dir=temp_root)
+        try:
+            return render_preview(
+                code, class_name, temp_dir, frame_selection, image_format, max_bytes, workspace
+            )
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def get_even_resolution(resolution: str) -> str:
+    """
+    Rounds a "width,height" resolution up to even numbers, as H.264 requires.
+    """
+    return ",".join(str(int(size) + int(size) % 2) for size in resolution.split(","))
+
+
+def extract_frames(video_path: str, output_dir: str, class_name: str):
+    """
+    Writes every frame of a video as a PNG, named the way Manim names them.
+    """
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-i",
+            video_path,
+            "-vsync",
+            "passthrough",
+            "-start_number",
+            "0",
+            os.path.join(output_dir, f"{class_name}%04d.png"),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def render_preview(
+    code: str,
+    class_name: str,
+    temp_dir: str,
+    frame_selection: FrameSelectionPolicy,
+    image_format: str,
+    max_bytes: int,
+    workspace: Union[PreviewWorkspace, None] = None,
+) -> str:
+    # Create the Python file in the temporary location
+    file_path = os.path.join(temp_dir, f"{class_name}.py")
+
+    preview_code = f"""
+from manim import *
+from math import *
+
+{code}
+"""
+
+    with open(file_path, "w") as f:
+        f.write(preview_code)
+
+    if workspace:
+        command = [
+            "manim",
+            file_path,
+            class_name,
+            "--format=mp4",
+            "--media_dir",
+            workspace.media_dir,
+            "--custom_folders",
+            "-ql",
+            "--resolution",
+            get_even_resolution(PREVIEW_RESOLUTION),
+            "--frame_rate",
+            PREVIEW_FRAME_RATE,
+        ]
+    else:
+        command = [
+            "manim",
+            file_path,
+            class_name,
+            "--format=png",
+            "--media_dir",
+            temp_dir,
+            "--custom_folders",
+            "-ql",
+            "--resolution",
+            PREVIEW_RESOLUTION,
+            "--frame_rate",
+            PREVIEW_FRAME_RATE,
+            "--disable_caching",
+        ]
+    if workspace:
+        # The outputs of the previous preview of the workspace
+        video_path = os.path.join(workspace.media_dir, f"{class_name}.mp4")
+        last_frame_path = os.path.join(workspace.media_dir, f"{class_name}.png")
+        for path in (video_path, last_frame_path):
+            if os.path.exists(path):
+                os.remove(path)
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+
+        print(f"Result: {result}")
+
+        if workspace:
+            if os.path.exists(video_path):
+                extract_frames(video_path, temp_dir, class_name)
+            elif os.path.exists(last_frame_path):
+                shutil.move(last_frame_path, os.path.join(temp_dir, f"{class_name}0000.png"))
+
+        # Find all PNG files in the render directory, by frame index
+        frames = {}
+        for png_file in os.listdir(temp_dir):
+            match = re.search(r"(\d+)\.png$", png_file)
+            if match:
+                frames[int(match.group(1))] = png_file
+
+        if not frames:
+            print(f"No PNG files found in: {temp_dir}")
+            return json.dumps({
+                "error": f"No preview files generated at expected location: {temp_dir}",
+                "images": []
+            })
+
+        # Move the generated PNGs to a random folder of the preview storage
+        random_string = "".join(random.choices(string.ascii_letters + string.digits, k=12))
+        preview_storage = get_preview_storage()
+        for index, png_file in frames.items():
+            frames[index] = f"{random_string}/{class_name}/{png_file}"
+            preview_storage.save(os.path.join(temp_dir, png_file), frames[index])
+
+        image_paths = {
+            index: preview_storage.get_path(frames[index])
+            for index in frame_selection(sorted(frames))
+        }
+        image_list = encode_frames(image_paths, image_format, max_bytes)
+        return json.dumps({
+            "message": "Animation preview generated. Now you will see the image frames in the next automatic message...",
+            "images": image_list
+        })
+    except subprocess.CalledProcessError as e:
+        error_output = e.stdout + e.stderr
+        print(f"Error running Manim command: {str(e)}")
+        print(f"Command output:\n{error_output}")
+        return json.dumps({
+            "error": f"ERROR. Error generating preview, please think on what could be the problem, and use `get_preview` to run the code again: {str(e)}\nCommand output:\n{error_output}",
+            "images": []
+        })
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return json.dumps({
+            "error": f"Unexpected error: {str(e)}",
+            "images": []
+        })
@@ -0,0 +1,93 @@
+"""
+Per-conversation preview workspaces.
+
+In the chat flow the model previews a scene, changes one or two animations,
+and previews it again. A workspace keeps Manim's media folder (partial movie
+files, Tex and text caches) between the previews of a conversation, so Manim
+only renders the animations whose hash changed.
+
+Workspaces not used for `PREVIEW_WORKSPACE_TTL` seconds are deleted.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+PREVIEW_WORKSPACE_TTL = int(os.getenv("PREVIEW_WORKSPACE_TTL", "1800"))
+
+WORKSPACES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp_manim", "workspaces"
+)
+
+
+class PreviewWorkspace:
+    """
+    Media folder of a conversation. Previews of the same workspace run one at
+    a time, as they write to the same files.
+    """
+
+    def __init__(self, workspace_id: str, root: str = WORKSPACES_DIR):
+        self.id = workspace_id
+        self.media_dir = os.path.join(root, workspace_id)
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        os.makedirs(self.media_dir, exist_ok=True)
+
+    def touch(self):
+        self.last_used = time.time()
+        os.makedirs(self.media_dir, exist_ok=True)
+        # The folder's mtime lets cleanup find expired workspaces after a restart
+        os.utime(self.media_dir)
+
+    def is_expired(self) -> bool:
+        return time.time() - self.last_used > PREVIEW_WORKSPACE_TTL
+
+
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+
+
+def cleanup_expired_workspaces(root: str = WORKSPACES_DIR):
+    """
+    Deletes the workspaces that expired, including the ones left over by a
+    previous run of the server. Must be called with `_workspaces_lock` held.
+    """
+    for workspace_id, workspace in list(_workspaces.items()):
+        # A workspace being rendered isn't deleted, even if it's expired
+        if workspace.is_expired() and workspace.lock.acquire(blocking=False):
+            try:
+                del _workspaces[workspace_id]
+                shutil.rmtree(workspace.media_dir, ignore_errors=True)
+            finally:
+                workspace.lock.release()
+
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name in _workspaces:
+            continue
+        try:
+            expired = time.time() - os.path.getmtime(path) > PREVIEW_WORKSPACE_TTL
+        except OSError:
+            continue
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def get_preview_workspace(conversation_id: str) -> PreviewWorkspace:
+    """
+    Returns the workspace of a conversation, creating it if needed.
+    """
+    # The ID comes from the client, so it isn't used as a path as is
+    workspace_id = hashlib.sha256(conversation_id.encode("utf-8")).hexdigest()[:32]
+    with _workspaces_lock:
+        cleanup_expired_workspaces()
+        workspace = _workspaces.get(workspace_id)
+        if workspace is None:
+            workspace = PreviewWorkspace(workspace_id)
+            _workspaces[workspace_id] = workspace
+        workspace.last_used = time.time()
+        return workspace
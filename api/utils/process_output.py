@@ -0,0 +1,63 @@
+"""
+Non-blocking reader for the output of a Manim render.
+
+Reading `stdout` and `stderr` of a process one line at a time from the same
+thread blocks on whichever pipe is quiet, and can deadlock once the other
+pipe's buffer fills up. Here every source is drained by its own thread into
+a single queue, so lines are available as soon as Manim prints them.
+"""
+
+import queue
+import subprocess
+import threading
+from typing import Iterable, List, Tuple
+
+_SOURCE_DONE = object()
+
+
+class OutputReader:
+    """
+    Merges several sources of `(stream, line)` tuples into one iterator, in
+    the order the lines arrive.
+    """
+
+    def __init__(self, sources: List[Iterable[Tuple[str, str]]]):
+        self.lines = queue.Queue()
+        self.remaining_sources = len(sources)
+        for source in sources:
+            thread = threading.Thread(target=self.drain, args=(source,), daemon=True)
+            thread.start()
+
+    def drain(self, source: Iterable[Tuple[str, str]]):
+        try:
+            for item in source:
+                self.lines.put(item)
+        except (OSError, ValueError) as e:
+            self.lines.put(("stderr", f"Failed to read render output: {e}\n"))
+        finally:
+            self.lines.put(_SOURCE_DONE)
+
+    def has_pending(self) -> bool:
+        """
+        Whether more lines are already waiting to be read.
+        """
+        return not self.lines.empty()
+
+    def __iter__(self):
+        while self.remaining_sources:
+            item = self.lines.get()
+            if item is _SOURCE_DONE:
+                self.remaining_sources -= 1
+                continue
+            yield item
+
+
+def get_process_output_sources(process: subprocess.Popen) -> List[Iterable[Tuple[str, str]]]:
+    """
+    Returns the `stdout` and `stderr` lines of a process as reader sources.
+    """
+    return [
+        (("stdout", line) for line in process.stdout),
+        (("stderr", line) for line in process.stderr),
+    ]
+
@@ -0,0 +1,241 @@
+"""
+Content-addressed cache of rendered videos.
+
+The same scene is often rendered again without any change (for example when
+the chat UI re-submits it). Renders are keyed by a hash of the normalized
+code, the scene class, the frame configuration and the Manim version, and
+the index keeps track of the storage the resulting video was saved to (see
+`storage.py`).
+
+The storage owns the videos: the local one deletes them in least-recently-
+used order beyond its budget, and entries whose video is gone are dropped on
+lookup. The index itself keeps at most `RENDER_CACHE_MAX_ENTRIES` entries.
+
+The index is shared by the server processes through a JSON file. Lookups
+only touch the in-memory copy; changes are merged into the file under a file
+lock (`fcntl`, or `msvcrt` on Windows) when an entry is added or dropped.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Tuple, Union
+
+from api.utils.storage import Storage
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+    import msvcrt
+
+USE_RENDER_CACHE = os.getenv("USE_RENDER_CACHE", "true") == "true"
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "10000"))
+RENDER_CACHE_INDEX_PATH = os.getenv(
+    "RENDER_CACHE_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "render_cache.json"),
+)
+
+
+@lru_cache(maxsize=1)
+def get_manim_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("manim")
+    except Exception:
+        return "unknown"
+
+
+def normalize_code(code: str) -> str:
+    """
+    Normalizes line endings and trailing whitespace, which don't change the
+    rendered video.
+    """
+    lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+def get_render_cache_key(
+    code: str,
+    file_class: Union[str, None],
+    frame_size: Tuple[int, int],
+    frame_width: float,
+    profile: Union[dict, None] = None,
+) -> str:
+    """
+    Returns the content hash that identifies a render.
+    """
+    profile = profile or {}
+    payload = json.dumps(
+        {
+            "code": normalize_code(code),
+            "file_class": file_class or "GenScene",
+            "frame_size": list(frame_size),
+            "frame_width": frame_width,
+            "frame_rate": profile.get("frame_rate"),
+            "codec": profile.get("codec"),
+            "crf": profile.get("crf"),
+            "manim_version": get_manim_version(),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def lock_index_file(lock_path: str):
+    """
+    Holds an exclusive lock on `lock_path`, shared by the server processes.
+    """
+    with open(lock_path, "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+            return
+        # `LK_LOCK` only retries for 10 seconds before failing
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RenderCache:
+    """
+    Index of rendered videos, persisted as JSON.
+
+    Entries look like:
+    `{"storage": "local" | "azure" | "tiered", "file_name": str,
+    "last_access": float}`
+    """
+
+    def __init__(self, index_path: str = RENDER_CACHE_INDEX_PATH):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Changes not written to the index file yet: key -> entry, or None
+        # for a dropped entry
+        self.changes = {}
+        self.index_mtime = None
+        with self.lock:
+            self.load()
+
+    def read_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        """
+        Reloads the index file, keeping the changes of this process. Must be
+        called with the lock held.
+        """
+        try:
+            self.index_mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            self.index_mtime = None
+        entries = self.read_index()
+        for key, entry in self.changes.items():
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+        self.entries = OrderedDict(
+            sorted(entries.items(), key=lambda item: item[1].get("last_access", 0))
+        )
+
+    def refresh(self):
+        """
+        Reloads the index if another process changed it. Must be called with
+        the lock held.
+        """
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.index_mtime:
+            self.load()
+
+    def save(self):
+        """
+        Merges the changes of this process into the index file. Must be
+        called with the lock held.
+        """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with lock_index_file(f"{self.index_path}.lock"):
+            self.load()
+            self.evict()
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.index_path)
+            self.index_mtime = os.stat(self.index_path).st_mtime_ns
+            self.changes = {}
+
+    def get(self, key: str, storage: Storage) -> Union[dict, None]:
+        """
+        Returns the entry for `key`, or None if it's missing, was saved to
+        another storage, or its file is gone.
+        """
+        with self.lock:
+            self.refresh()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["storage"] != storage.name or not storage.exists(entry["file_name"]):
+                del self.entries[key]
+                self.changes[key] = None
+                self.save()
+                return None
+            # Only in memory, the access time is written with the next change
+            entry["last_access"] = time.time()
+            self.entries.move_to_end(key)
+            self.changes[key] = entry
+            return entry
+
+    def put(self, key: str, storage: Storage, file_name: str):
+        with self.lock:
+            entry = {
+                "storage": storage.name,
+                "file_name": file_name,
+                "last_access": time.time(),
+            }
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.changes[key] = entry
+            self.save()
+
+    def evict(self):
+        """
+        Drops least-recently-used entries beyond `RENDER_CACHE_MAX_ENTRIES`.
+        Their videos are left to the storage. Must be called with the lock
+        held.
+        """
+        while len(self.entries) > RENDER_CACHE_MAX_ENTRIES:
+            self.entries.popitem(last=False)
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+        return _render_cache
@@ -0,0 +1,189 @@
+"""
+Pool of warm Manim render workers.
+
+Starting the `manim` CLI for every render pays the interpreter start-up and
+the `from manim import *` import cost before a single frame is drawn. The
+pool keeps a few long-lived worker processes (see `render_worker.py`) that
+have Manim already imported, and sends them jobs over their stdin.
+
+Workers are recycled after `RENDER_POOL_MAX_JOBS` jobs or once their memory
+grows beyond `RENDER_POOL_MAX_MEMORY_MB`.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from typing import List, Union
+
+USE_RENDER_POOL = os.getenv("USE_RENDER_POOL", "false") == "true"
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_worker.py")
+
+
+class RenderWorker:
+    """
+    A single warm worker process.
+    """
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self.ready = False
+        self.recycle = False
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def read_message(self) -> Union[dict, None]:
+        line = self.process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def wait_until_ready(self):
+        while not self.ready:
+            message = self.read_message()
+            if message is None:
+                raise RuntimeError("Render worker exited during start-up")
+            if message["event"] == "ready":
+                self.ready = True
+
+    def send_job(self, args: List[str], cwd: str):
+        self.process.stdin.write(json.dumps({"args": args, "cwd": cwd}) + "\n")
+        self.process.stdin.flush()
+
+    def stop(self):
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class RenderJob:
+    """
+    A render running on a pooled worker.
+
+    Iterating over the job yields `(stream, line)` tuples with the output of
+    Manim, where `stream` is "stdout" or "stderr". Once the iteration is
+    over, `returncode` holds the exit code of the render.
+    """
+
+    def __init__(self, pool: "RenderWorkerPool", args: List[str], cwd: str):
+        self.pool = pool
+        self.args = args
+        self.cwd = cwd
+        self.returncode = None
+        self.worker = None
+        self.cancelled = False
+
+    def __iter__(self):
+        if self.cancelled:
+            self.returncode = 1
+            return
+        worker = self.pool.acquire()
+        self.worker = worker
+        finished = False
+        try:
+            try:
+                worker.wait_until_ready()
+                worker.send_job(self.args, self.cwd)
+            except (RuntimeError, OSError) as e:
+                worker.recycle = True
+                self.returncode = 1
+                finished = True
+                yield "stderr", f"Render worker failed to start: {e}\n"
+                return
+
+            while True:
+                message = worker.read_message()
+                if message is None:
+                    worker.recycle = True
+                    self.returncode = 1
+                    finished = True
+                    yield "stderr", "Render worker exited unexpectedly\n"
+                    return
+                if message["event"] == "output":
+                    yield message["stream"], message["line"]
+                elif message["event"] == "done":
+                    worker.recycle = message["recycle"]
+                    self.returncode = message["returncode"]
+                    finished = True
+                    return
+        finally:
+            # If the caller stopped reading before the job finished, the
+            # worker still has output pending, so it can't be reused.
+            if not finished:
+                worker.recycle = True
+            self.worker = None
+            self.pool.release(worker)
+
+    def cancel(self):
+        """
+        Stops the render if it's running. The worker is killed and replaced
+        by a new one when the job releases it.
+        """
+        self.cancelled = True
+        worker = self.worker
+        if worker is not None:
+            worker.recycle = True
+            worker.stop()
+
+
+class RenderWorkerPool:
+    """
+    Fixed-size pool of warm render workers.
+    """
+
+    def __init__(self, size: int = RENDER_POOL_SIZE):
+        self.size = max(1, size)
+        self.idle_workers = queue.Queue()
+        for _ in range(self.size):
+            self.idle_workers.put(RenderWorker())
+
+    def acquire(self) -> RenderWorker:
+        worker = self.idle_workers.get()
+        if not worker.is_alive():
+            worker = RenderWorker()
+        return worker
+
+    def release(self, worker: RenderWorker):
+        if worker.recycle or not worker.is_alive():
+            worker.stop()
+            worker = RenderWorker()
+        self.idle_workers.put(worker)
+
+    def submit(self, args: List[str], cwd: str) -> RenderJob:
+        """
+        Returns a job that renders `manim <args>` from `cwd` once iterated.
+        """
+        return RenderJob(self, args, cwd)
+
+    def shutdown(self):
+        while True:
+            try:
+                self.idle_workers.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderWorkerPool:
+    """
+    Returns the process-wide render pool, starting it on first use.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = RenderWorkerPool()
+        return _render_pool
@@ -0,0 +1,162 @@
+"""
+Render profiles and render cost estimation.
+
+A profile sets the resolution (the size of the smaller side of the frame,
+whatever the aspect ratio), the frame rate and the encoding of a render.
+The `original` profile keeps the historical sizes of `get_frame_config`
+(3840x2160 for 16:9, 1080 pixels wide for 9:16 and 1:1).
+
+Requests can pick a profile by name; otherwise the profile of their API key
+(`RENDER_PROFILES_BY_API_KEY`, a JSON object of API key to profile name) or
+`DEFAULT_RENDER_PROFILE` is used. The API key is read from the
+`Authorization: Bearer` header sent by the SDK, or from `X-API-Key`.
+
+Manim always encodes with libx264 at CRF 23 (the libx264 default), so only
+profiles with another codec or another CRF are re-encoded with ffmpeg after
+the render.
+"""
+
+import ast
+import json
+import os
+import subprocess
+from typing import List, Mapping, Tuple, Union
+
+RENDER_PROFILES = {
+    "preview": {"size": 480, "frame_rate": 15, "codec": "libx264", "crf": 28},
+    "720p": {"size": 720, "frame_rate": 30, "codec": "libx264", "crf": None},
+    "1080p": {"size": 1080, "frame_rate": 30, "codec": "libx264", "crf": None},
+    "4k": {"size": 2160, "frame_rate": 60, "codec": "libx264", "crf": None},
+    "original": {"size": None, "frame_rate": 60, "codec": "libx264", "crf": None},
+}
+
+DEFAULT_RENDER_PROFILE = os.getenv("DEFAULT_RENDER_PROFILE", "original")
+RENDER_PROFILES_BY_API_KEY = json.loads(os.getenv("RENDER_PROFILES_BY_API_KEY", "{}"))
+
+# Cost model of a render, in seconds: start-up, then per animation and per
+# megapixel of rendered frames
+RENDER_COST_STARTUP_SECONDS = float(os.getenv("RENDER_COST_STARTUP_SECONDS", "3"))
+RENDER_COST_ANIMATION_SECONDS = float(os.getenv("RENDER_COST_ANIMATION_SECONDS", "0.5"))
+RENDER_COST_MEGAPIXEL_SECONDS = float(os.getenv("RENDER_COST_MEGAPIXEL_SECONDS", "0.05"))
+
+# Encoding of the videos written by Manim
+MANIM_CODEC = "libx264"
+MANIM_CRF = 23
+
+# Manim's default run time of `self.play()` and `self.wait()`
+DEFAULT_RUN_TIME = 1.0
+
+
+def get_api_key(headers: Mapping[str, str]) -> Union[str, None]:
+    """
+    Returns the API key of a request, from its `Authorization: Bearer` or
+    `X-API-Key` header.
+    """
+    authorization = headers.get("Authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip() or None
+    return headers.get("X-API-Key")
+
+
+def get_render_profile(name: Union[str, None] = None, api_key: Union[str, None] = None) -> dict:
+    """
+    Returns the profile `name`, or the default profile of the API key.
+    Raises `ValueError` for an unknown profile.
+    """
+    name = name or RENDER_PROFILES_BY_API_KEY.get(api_key) or DEFAULT_RENDER_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(
+            f"Unknown render profile '{name}'. Must be one of: {', '.join(RENDER_PROFILES)}"
+        )
+    return {"name": name, **RENDER_PROFILES[name]}
+
+
+def get_profile_frame_size(profile: dict, frame_size: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Scales the frame size of an aspect ratio so its smaller side matches the
+    profile, keeping even dimensions as H.264 requires.
+    """
+    if not profile["size"]:
+        return frame_size
+    scale = profile["size"] / min(frame_size)
+    width, height = (round(size * scale / 2) * 2 for size in frame_size)
+    return width, height
+
+
+def needs_reencoding(profile: dict) -> bool:
+    return profile["codec"] != MANIM_CODEC or profile["crf"] not in (None, MANIM_CRF)
+
+
+def reencode_video(video_path: str, profile: dict):
+    """
+    Re-encodes a video in place with the codec and CRF of the profile.
+    """
+    output_path = f"{os.path.splitext(video_path)[0]}.reencoded.mp4"
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", video_path, "-c:v", profile["codec"]]
+    if profile["crf"] is not None:
+        command += ["-crf", str(profile["crf"])]
+    command += ["-pix_fmt", "yuv420p", "-c:a", "copy", "-movflags", "+faststart", output_path]
+    subprocess.run(command, check=True)
+    os.replace(output_path, video_path)
+
+
+def get_animation_calls(code: str) -> List[ast.Call]:
+    """
+    Returns the `self.play()` and `self.wait()` calls of the code. Calls made
+    in loops only appear once.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    return [
+        node
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr in ("play", "wait")
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == "self"
+    ]
+
+
+def get_call_run_time(call: ast.Call) -> float:
+    """
+    Returns the run time of a `self.play()` or `self.wait()` call, when it's
+    a literal, or Manim's default.
+    """
+    arguments = [keyword.value for keyword in call.keywords if keyword.arg in ("run_time", "duration")]
+    if call.func.attr == "wait" and call.args:
+        arguments.append(call.args[0])
+    for argument in arguments:
+        if isinstance(argument, ast.Constant) and isinstance(argument.value, (int, float)):
+            return float(argument.value)
+    return DEFAULT_RUN_TIME
+
+
+def estimate_render_cost(code: str, profile: dict, frame_size: Tuple[int, int]) -> dict:
+    """
+    Estimates the size of a render from the code, before rendering it. Loops
+    and computed run times aren't evaluated, so this is a lower bound for
+    scenes that use them.
+    """
+    calls = get_animation_calls(code)
+    duration = sum(get_call_run_time(call) for call in calls)
+    width, height = get_profile_frame_size(profile, frame_size)
+    frames = round(duration * profile["frame_rate"])
+    megapixels = width * height * frames / 1_000_000
+    return {
+        "profile": profile["name"],
+        "resolution": [width, height],
+        "frame_rate": profile["frame_rate"],
+        "animations": len(calls),
+        "duration": duration,
+        "frames": frames,
+        "megapixels": round(megapixels, 1),
+        "estimated_render_seconds": round(
+            RENDER_COST_STARTUP_SECONDS
+            + RENDER_COST_ANIMATION_SECONDS * len(calls)
+            + RENDER_COST_MEGAPIXEL_SECONDS * megapixels,
+            1,
+        ),
+    }
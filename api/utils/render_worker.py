@@ -0,0 +1,179 @@
+"""
+Warm Manim render worker.
+
+This script is launched by `api/utils/render_pool.py` as a long-lived child
+process. It imports Manim once at startup and then renders jobs received as
+JSON lines on stdin, running Manim's `render` command in-process. Everything
+Manim prints is forwarded back to the parent as JSON lines on the original
+stdout, so the parent sees the same stdout/stderr lines as with the CLI.
+
+It only depends on the standard library and Manim on purpose, so it can be
+started without importing the Flask application.
+"""
+
+import json
+import os
+import re
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class _StreamProxy:
+    """
+    File-like object that replaces `sys.stdout`/`sys.stderr` in the worker.
+
+    While a job is running, complete lines are sent to the parent as
+    `output` events. Outside of a job, writes go to the worker's stderr.
+    """
+
+    def __init__(self, name, channel, fallback):
+        self.name = name
+        self.channel = channel
+        self.fallback = fallback
+        self.active = False
+        self.buffer = ""
+
+    def write(self, text):
+        if not self.active:
+            return self.fallback.write(text)
+        self.buffer += text
+        # tqdm redraws progress bars with "\r", treat it as a line break
+        # like the universal newlines mode of `subprocess.Popen(text=True)`.
+        *lines, self.buffer = re.split(r"\r\n|\r|\n", self.buffer)
+        for line in lines:
+            self.channel.send({"event": "output", "stream": self.name, "line": line + "\n"})
+        return len(text)
+
+    def flush(self):
+        if not self.active:
+            self.fallback.flush()
+
+    def finish(self):
+        if self.buffer:
+            self.channel.send({"event": "output", "stream": self.name, "line": self.buffer + "\n"})
+            self.buffer = ""
+        self.active = False
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        return self.fallback.fileno()
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+
+class _Channel:
+    """
+    JSON lines channel to the parent process.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def send(self, message):
+        self.stream.write(json.dumps(message) + "\n")
+        self.stream.flush()
+
+
+def get_memory_usage_mb():
+    """
+    Returns the peak resident set size of the worker in MB.
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def unload_scene_module(file_path):
+    """
+    Removes the module created by Manim for the scene file, so the next job
+    with a file of the same name imports its own code.
+    """
+    real_path = os.path.realpath(file_path)
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and os.path.realpath(module_file) == real_path:
+            del sys.modules[name]
+
+
+def run_job(job, stdout, stderr):
+    """
+    Runs `manim <args>` in-process and returns the exit code.
+    """
+    import click
+    from manim import tempconfig
+    from manim.cli.render.commands import render
+
+    args = job["args"]
+    previous_cwd = os.getcwd()
+    previous_path = list(sys.path)
+    stdout.active = True
+    stderr.active = True
+    returncode = 0
+    try:
+        os.chdir(job.get("cwd") or previous_cwd)
+        # `tempconfig` restores Manim's global config, which both the CLI
+        # arguments and the scene code (e.g. `config.frame_size`) modify.
+        with tempconfig({}):
+            render.main(args=args, prog_name="manim", standalone_mode=False)
+    except SystemExit as e:
+        returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except click.exceptions.ClickException as e:
+        e.show(file=sys.stderr)
+        returncode = e.exit_code
+    except Exception:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        stdout.finish()
+        stderr.finish()
+        os.chdir(previous_cwd)
+        sys.path[:] = previous_path
+        if args:
+            unload_scene_module(args[0])
+    return returncode
+
+
+def main():
+    max_jobs = int(os.getenv("RENDER_POOL_MAX_JOBS", "20"))
+    max_memory_mb = int(os.getenv("RENDER_POOL_MAX_MEMORY_MB", "1024"))
+
+    # Keep the real stdout for the protocol, and send stray writes to the
+    # file descriptor (e.g. from ffmpeg) to stderr so they can't corrupt it.
+    channel = _Channel(os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8"))
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    # Install the proxies before importing Manim, its consoles keep a
+    # reference to the streams that exist at import time.
+    stdout = _StreamProxy("stdout", channel, sys.__stderr__)
+    stderr = _StreamProxy("stderr", channel, sys.__stderr__)
+    sys.stdout = stdout
+    sys.stderr = stderr
+
+    import manim  # noqa: F401
+
+    channel.send({"event": "ready", "pid": os.getpid()})
+
+    jobs_done = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        returncode = run_job(job, stdout, stderr)
+        jobs_done += 1
+        recycle = jobs_done >= max_jobs or get_memory_usage_mb() > max_memory_mb
+        channel.send({"event": "done", "returncode": returncode, "recycle": recycle})
+        if recycle:
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Storage backends for rendered videos, exports and preview frames.
+
+- `LocalStorage` keeps files in a folder served by the API, bounded in
+  size: least-recently-used files are deleted beyond `max_size_mb`
+  (`LOCAL_STORAGE_MAX_SIZE_MB` for videos, 2 GB by default).
+- `AzureStorage` uploads files to Azure Blob Storage (see `blob_storage.py`).
+- `TieredStorage` uploads files to Azure, and also keeps the most recent
+  ones in a bounded local cache. Its URLs point to `/v1/storage/<name>`,
+  which serves the local copy if it's still cached, and redirects to Azure
+  otherwise.
+
+`STORAGE_BACKEND` picks the backend used for videos ("local", "azure" or
+"tiered"). It defaults to "local" or "azure" depending on
+`USE_LOCAL_STORAGE`, as before.
+"""
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Union
+
+from api.utils.blob_storage import get_blob_service_client, upload_file
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = os.getenv("BASE_URL", "http://127.0.0.1:8080")
+
+USE_LOCAL_STORAGE = os.getenv("USE_LOCAL_STORAGE", "true") == "true"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local" if USE_LOCAL_STORAGE else "azure")
+# The public folder is served by Flask at /public
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR") or os.path.join(API_DIR, "public", "videos")
+# Budget of the local videos folder, 0 for no limit
+LOCAL_STORAGE_MAX_SIZE_MB = int(os.getenv("LOCAL_STORAGE_MAX_SIZE_MB", "2048"))
+TIERED_CACHE_DIR = os.getenv("TIERED_CACHE_DIR") or os.path.join(API_DIR, "storage_cache")
+TIERED_CACHE_MAX_SIZE_MB = int(os.getenv("TIERED_CACHE_MAX_SIZE_MB", "2048"))
+PREVIEW_STORAGE_MAX_SIZE_MB = int(os.getenv("PREVIEW_STORAGE_MAX_SIZE_MB", "512"))
+
+
+class Storage:
+    """
+    Interface of the storage backends. Files are identified by a name, which
+    may contain slashes.
+    """
+
+    name = None
+    # Whether saving a file sends it over the network
+    is_remote = False
+
+    def save(self, file_path: str, name: str, base_url: Union[str, None] = None) -> str:
+        """
+        Stores a file, moving it when it's kept on disk, and returns its URL.
+        """
+        raise NotImplementedError
+
+    def get_url(self, name: str, base_url: Union[str, None] = None) -> str:
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, name: str):
+        raise NotImplementedError
+
+    def get_local_path(self, name: str) -> Union[str, None]:
+        """
+        Returns the path of a file on this server, or None if it isn't here.
+        """
+        return None
+
+    def get_name_from_url_path(self, path: str) -> Union[str, None]:
+        """
+        Returns the name of a file from the path of one of its URLs on this
+        server, or None if the path isn't one of this storage.
+        """
+        return None
+
+
+class LocalStorage(Storage):
+    name = "local"
+
+    def __init__(self, root: str, url_path: str, max_size_mb: int = 0):
+        self.root = root
+        self.url_path = url_path.rstrip("/")
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        # name -> size, least recently used first
+        self.files = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+        if self.max_size:
+            self.load()
+
+    def load(self):
+        files = []
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+        for _, name, size in sorted(files):
+            self.files[name] = size
+
+    def get_path(self, name: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid file name: {name}")
+        return path
+
+    def save(self, file_path: str, name: str, base_url: Union[str, None] = None) -> str:
+        path = self.get_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(file_path, path)
+        if self.max_size:
+            with self.lock:
+                self.files[name] = os.path.getsize(path)
+                self.files.move_to_end(name)
+                self.evict()
+        return self.get_url(name, base_url)
+
+    def evict(self):
+        """
+        Deletes least-recently-used files until the folder fits its budget.
+        Must be called with the lock held.
+        """
+        total_size = sum(self.files.values())
+        # The most recent file is kept, even if it's larger than the budget
+        while total_size > self.max_size and len(self.files) > 1:
+            name, size = self.files.popitem(last=False)
+            try:
+                os.remove(self.get_path(name))
+            except OSError:
+                pass
+            total_size -= size
+
+    def get_url(self, name: str, base_url: Union[str, None] = None) -> str:
+        url_base = base_url if base_url else BASE_URL
+        return f"{url_base.rstrip('/')}{self.url_path}/{name}"
+
+    def exists(self, name: str) -> bool:
+        return self.get_local_path(name) is not None
+
+    def delete(self, name: str):
+        with self.lock:
+            self.files.pop(name, None)
+        try:
+            os.remove(self.get_path(name))
+        except OSError:
+            pass
+
+    def get_local_path(self, name: str) -> Union[str, None]:
+        path = self.get_path(name)
+        if not os.path.isfile(path):
+            return None
+        if self.max_size:
+            # Mark the file as recently used
+            with self.lock:
+                if name in self.files:
+                    self.files.move_to_end(name)
+            os.utime(path)
+        return path
+
+    def get_name_from_url_path(self, path: str) -> Union[str, None]:
+        prefix = f"{self.url_path}/"
+        return path[len(prefix):] if path.startswith(prefix) else None
+
+
+class AzureStorage(Storage):
+    name = "azure"
+    is_remote = True
+
+    def get_blob_client(self, name: str):
+        return get_blob_service_client().get_blob_client(
+            container=os.getenv("AZURE_STORAGE_CONTAINER_NAME"), blob=name
+        )
+
+    def save(self, file_path: str, name: str, base_url: Union[str, None] = None) -> str:
+        try:
+            return upload_file(file_path, name)
+        finally:
+            os.remove(file_path)
+
+    def get_url(self, name: str, base_url: Union[str, None] = None) -> str:
+        return self.get_blob_client(name).url
+
+    def exists(self, name: str) -> bool:
+        # Blobs aren't deleted behind our back, checking would cost a request
+        return True
+
+    def delete(self, name: str):
+        self.get_blob_client(name).delete_blob()
+
+
+class TieredStorage(Storage):
+    """
+    Azure Blob Storage, with the most recent files also kept in a local cache.
+    """
+
+    name = "tiered"
+    is_remote = True
+
+    def __init__(self, hot: LocalStorage, cold: AzureStorage):
+        self.hot = hot
+        self.cold = cold
+
+    def save(self, file_path: str, name: str, base_url: Union[str, None] = None) -> str:
+        hot_copy = f"{file_path}.hot"
+        shutil.copyfile(file_path, hot_copy)
+        try:
+            self.cold.save(file_path, name)
+        except Exception:
+            os.remove(hot_copy)
+            raise
+        self.hot.save(hot_copy, name)
+        return self.get_url(name, base_url)
+
+    def get_url(self, name: str, base_url: Union[str, None] = None) -> str:
+        return self.hot.get_url(name, base_url)
+
+    def exists(self, name: str) -> bool:
+        return True
+
+    def delete(self, name: str):
+        self.hot.delete(name)
+        self.cold.delete(name)
+
+    def get_local_path(self, name: str) -> Union[str, None]:
+        return self.hot.get_local_path(name)
+
+    def get_name_from_url_path(self, path: str) -> Union[str, None]:
+        return self.hot.get_name_from_url_path(path)
+
+
+def create_storage(backend: str) -> Storage:
+    if backend == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR, "/public/videos", LOCAL_STORAGE_MAX_SIZE_MB)
+    if backend == "azure":
+        return AzureStorage()
+    if backend == "tiered":
+        return TieredStorage(
+            LocalStorage(TIERED_CACHE_DIR, "/v1/storage", TIERED_CACHE_MAX_SIZE_MB),
+            AzureStorage(),
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+_storage = None
+_preview_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """
+    Returns the storage of videos (renders and exports).
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage(STORAGE_BACKEND)
+        return _storage
+
+
+def get_preview_storage() -> LocalStorage:
+    """
+    Returns the storage of preview frames. They are only read by this
+    server, so they are always kept locally, within `PREVIEW_STORAGE_MAX_SIZE_MB`.
+    """
+    global _preview_storage
+    with _storage_lock:
+        if _preview_storage is None:
+            _preview_storage = LocalStorage(
+                os.path.join(API_DIR, "public", "previews"),
+                "/public/previews",
+                PREVIEW_STORAGE_MAX_SIZE_MB,
+            )
+        return _preview_storage
@@ -1,8 +1,13 @@
+import argparse
+import json
 import os
-import re
+import threading
 import time
 import requests
 import html2text
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
 
@@ -11,22 +16,32 @@ BASE_URL = "https://docs.manim.community/en/stable/"
 
 # Base directory to save the markdown files
 OUTPUT_DIR = "docs_md"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# File of the output directory where the crawl state is saved, to resume it
+CRAWL_STATE_FILE = ".crawl_state.json"
+# Pages fetched at the same time
+CRAWL_WORKERS = 8
+# Requests per second sent to each host, to be polite
+REQUESTS_PER_SECOND = 10
+# Attempts of a page before giving up on it
+MAX_ATTEMPTS = 3
+# The crawl state is saved every this many pages
+SAVE_EVERY = 20
 
 # A session to reuse HTTP connections
 session = requests.Session()
 
-def is_valid_url(url):
+def is_valid_url(url, base_url=BASE_URL):
     """
     Only allow URLs that belong to the docs.manim.community/en/stable/ site.
     """
     parsed = urlparse(url)
-    base_parsed = urlparse(BASE_URL)
+    base_parsed = urlparse(base_url)
     return (parsed.scheme in ("http", "https") and 
             parsed.netloc == base_parsed.netloc and 
             parsed.path.startswith(base_parsed.path))
 
-def url_to_local_path(url):
+def url_to_local_path(url, base_url=BASE_URL, output_dir=OUTPUT_DIR):
     """
     Convert a URL into a local file path that preserves the URL’s folder structure.
     
@@ -36,12 +51,12 @@ def url_to_local_path(url):
         docs_md/_modules/manim/mobject/geometry/line.html.md
     """
     parsed = urlparse(url)
-    base_path = urlparse(BASE_URL).path
+    base_path = urlparse(base_url).path
     # Get the relative path after the base
     rel_path = parsed.path[len(base_path):].lstrip("/")
     if not rel_path:
         rel_path = "index.html"
-    local_path = os.path.join(OUTPUT_DIR, rel_path)
+    local_path = os.path.join(output_dir, rel_path)
     # Ensure the file ends with .md (appending .md even if it ends with .html)
     local_path += ".md"
     return local_path
@@ -55,21 +70,101 @@ def convert_html_to_markdown(html_content):
     h.body_width = 0  # do not wrap lines
     return h.handle(html_content)
 
-def crawl(url, visited):
+class HostRateLimiter:
     """
-    Recursively crawl the documentation pages starting from the given URL.
+    Spaces out the requests sent to each host, shared by the crawl workers.
     """
-    if url in visited:
-        return
-    print(f"Processing: {url}")
-    visited.add(url)
-    
-    try:
-        response = session.get(url)
-        response.raise_for_status()
-    except Exception as e:
-        print(f"Failed to get {url}: {e}")
-        return
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self.lock = threading.Lock()
+        # host -> earliest time of its next request
+        self.next_times = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_times.get(host, now))
+            self.next_times[host] = slot + self.interval
+        time.sleep(slot - now)
+
+class CrawlState:
+    """
+    State of a crawl, saved as JSON so an interrupted crawl can resume:
+    - frontier: URLs left to process, in order
+    - discovered: every URL found by this crawl, processed or not
+    - pages: the ETag, Last-Modified and links of each page fetched, kept
+      between crawls to only download the pages that changed
+    - attempts: failed attempts of the URLs of the frontier
+    """
+
+    def __init__(self, path):
+        self.path = path
+        state = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        self.frontier = deque(state.get("frontier", []))
+        self.discovered = set(state.get("discovered", []))
+        self.pages = state.get("pages", {})
+        self.attempts = state.get("attempts", {})
+
+    def start(self, start_url):
+        """
+        Resumes the previous crawl if it didn't finish, or starts a new one.
+        """
+        if self.frontier:
+            print(f"Resuming the crawl: {len(self.frontier)} pages left, {len(self.discovered)} discovered")
+            return
+        self.discovered = set()
+        self.attempts = {}
+        self.add(start_url)
+
+    def add(self, url):
+        if url not in self.discovered:
+            self.discovered.add(url)
+            self.frontier.append(url)
+
+    def save(self, in_flight=()):
+        """
+        Saves the state. Pages being fetched are saved in the frontier, so
+        they are fetched again on resume.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "frontier": list(in_flight) + list(self.frontier),
+                    "discovered": sorted(self.discovered),
+                    "pages": self.pages,
+                    "attempts": self.attempts,
+                },
+                f,
+            )
+        os.replace(temp_path, self.path)
+
+def fetch_page(url, page, limiter, base_url=BASE_URL, output_dir=OUTPUT_DIR):
+    """
+    Fetches a page and saves it as markdown, unless it didn't change since
+    the last crawl. Returns the page's ETag, Last-Modified and links, and
+    whether it changed.
+    """
+    local_path = url_to_local_path(url, base_url, output_dir)
+    headers = {}
+    # Conditional request, if we still have the markdown of the last crawl
+    if page and os.path.exists(local_path):
+        if page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+
+    limiter.wait(url)
+    response = session.get(url, headers=headers, timeout=30)
+    if response.status_code == 304:
+        return page, False
+    response.raise_for_status()
 
     html_content = response.text
     soup = BeautifulSoup(html_content, "html.parser")
@@ -84,22 +179,102 @@ def crawl(url, visited):
 
     markdown = convert_html_to_markdown(content_html)
     
-    # Determine the local file path and ensure its directory exists
-    local_path = url_to_local_path(url)
+    # Ensure the directory of the local file exists
     os.makedirs(os.path.dirname(local_path), exist_ok=True)
     
     with open(local_path, "w", encoding="utf-8") as f:
         f.write(markdown)
     print(f"Saved markdown to {local_path}")
 
-    # Find and process links on the page
+    # Find the links to other pages of the docs
+    links = []
     for link in soup.find_all("a", href=True):
-        href = link["href"]
-        full_url = urljoin(url, href)
+        full_url = urljoin(url, link["href"])
         full_url = full_url.split("#")[0]  # remove any fragment identifier
-        if is_valid_url(full_url) and full_url not in visited:
-            time.sleep(0.1)  # be polite with a short delay
-            crawl(full_url, visited)
+        if is_valid_url(full_url, base_url) and full_url not in links:
+            links.append(full_url)
+
+    page = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "links": links,
+    }
+    return page, True
+
+def crawl(
+    base_url=BASE_URL,
+    output_dir=OUTPUT_DIR,
+    workers=CRAWL_WORKERS,
+    requests_per_second=REQUESTS_PER_SECOND,
+):
+    """
+    Crawls the documentation pages from `base_url`, fetching `workers` pages
+    at a time. The crawl state is saved in the output directory: an
+    interrupted crawl resumes where it stopped, and a new crawl only
+    downloads the pages that changed.
+    """
+    state = CrawlState(os.path.join(output_dir, CRAWL_STATE_FILE))
+    state.start(base_url)
+    limiter = HostRateLimiter(requests_per_second)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # future -> URL of the pages being fetched
+    in_flight = {}
+    counts = {"changed": 0, "unchanged": 0, "failed": 0}
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while state.frontier or in_flight:
+                while state.frontier and len(in_flight) < workers:
+                    url = state.frontier.popleft()
+                    print(f"Processing: {url}")
+                    future = executor.submit(
+                        fetch_page, url, state.pages.get(url), limiter, base_url, output_dir
+                    )
+                    in_flight[future] = url
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    try:
+                        page, changed = future.result()
+                    except Exception as e:
+                        attempts = state.attempts.get(url, 0) + 1
+                        status_code = getattr(getattr(e, "response", None), "status_code", None)
+                        # Missing pages won't come back by retrying
+                        retryable = status_code is None or status_code == 429 or status_code >= 500
+                        if retryable and attempts < MAX_ATTEMPTS:
+                            print(f"Failed to get {url} (attempt {attempts}), retrying later: {e}")
+                            state.attempts[url] = attempts
+                            state.frontier.append(url)
+                        else:
+                            print(f"Failed to get {url}: {e}")
+                            state.attempts.pop(url, None)
+                            counts["failed"] += 1
+                        continue
+
+                    state.attempts.pop(url, None)
+                    state.pages[url] = page
+                    counts["changed" if changed else "unchanged"] += 1
+                    for link in page["links"]:
+                        state.add(link)
+
+                    processed += 1
+                    if processed % SAVE_EVERY == 0:
+                        state.save(in_flight.values())
+        except BaseException:
+            # Keep what was done, so the next run resumes from here
+            for future in in_flight:
+                future.cancel()
+            state.save(in_flight.values())
+            raise
+    state.save()
+    print(
+        f"Crawled {counts['changed'] + counts['unchanged']} pages: {counts['changed']} changed, "
+        f"{counts['unchanged']} unchanged, {counts['failed']} failed"
+    )
 
 def combine_markdown_files(root_dir, output_file):
     """
@@ -135,10 +310,17 @@ def combine_markdown_files(root_dir, output_file):
     print(f"Combined markdown saved to {output_file}")
 
 if __name__ == "__main__":
-    visited = set()
-    crawl(BASE_URL, visited)
+    parser = argparse.ArgumentParser(description="Download the Manim docs as markdown.")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    crawl(args.base_url, args.output_dir, args.workers, args.requests_per_second)
     print("Download complete.")
 
     # After crawling, combine all markdown files into one huge markdown file.
     combined_output = "combined_docs.md"
-    combine_markdown_files(OUTPUT_DIR, combined_output)
+    combine_markdown_files(args.output_dir, combined_output)